@@ -1,28 +1,58 @@
+import json
+import signal
+import logging
+from itertools import count
+from functools import partial
 from operator import attrgetter, methodcaller
 
-from work.models import cmd
+from work.models import cmd, replies
 from work.protocol import feed
 from work.cmdargs import get_cmd_args
-from work.utils import get_random_hash
+from work.utils import get_random_hash, configure_logging
+from work.metrics import snapshot, dump
 from work.loop import EventLoop
+from work.profiler import Profiler
+from work.timers import TimingWheel
 from work.layer import Factory, Protocol
+from work.datagram import DatagramServer
+from work.workers import WorkerFactory, Supervisor
+from work.aio import AsyncioLoop, AsyncioFactory
 
 
 class CommandProtocol(Protocol):
 
+    DELAY = 1.0
+
     def connection_made(self):
         self.feeder = feed()
         next(self.feeder)
         self.session = get_random_hash()
+        self.delayed = {}
+        self.delayed_ids = count()
 
     def data_received(self, data):
-        packet = self.feeder.send(data)
-        if packet:
-            getattr(self, packet.__class__.__name__.lower())(packet)
+        packets = self.feeder.send(data)
+        self.transport.count_frames(len(packets))
+        for packet in packets:
+            try:
+                getattr(self, packet.__class__.__name__.lower())(packet)
+            except Exception as exc:
+                # an unexpected packet, or a bug, costs only this connection
+                logging.exception('closing client %s', self.session)
+                if self.transport is not None:
+                    self.connection_lost(exc)
+            if self.transport is None or self.transport.closing:
+                break
+
+    def connection_lost(self, reason=None):
+        replies.evict(self.session)
+        for dc in self.delayed.values():
+            dc.cancel()
+        self.delayed.clear()
+        super().connection_lost(reason)
 
     def send_to_all(self, data):
-        for client in self.factory.clients[:]:
-            client.transport.write(data)
+        self.factory.broadcast(data)
 
     def connect(self, packet):
         self.send_to_all(packet.reply(self.session))
@@ -33,18 +63,88 @@ class CommandProtocol(Protocol):
     def pingd(self, packet):
         self.transport.write(packet.reply())
 
+    def delay(self, packet):
+        key = next(self.delayed_ids)
+        self.delayed[key] = self.factory.eventloop.call_later(
+            self.DELAY, self.send_delayed, key, packet.reply())
+
+    def send_delayed(self, eventloop, key, data):
+        del self.delayed[key]
+        self.transport.write(data)
+
+    def stats(self, packet):
+        data = snapshot(self.factory.eventloop, self.factory, self.transport)
+        self.transport.write(packet.reply(json.dumps(data)))
+
     def quit(self, packet):
         self.send_to_all(packet.reply(self.session))
-        self.connection_lost()
+        # the broadcast disconnects a sender that is too far behind
+        if self.transport is not None:
+            self.transport.close()
 
     def finish(self, packet):
         self.send_to_all(packet.reply(self.session))
-        self.factory.close()
+        self.factory.finish()
+
+
+def listen(factory, args):
+    if args.unix:
+        factory.listen_unix(args.unix)
+    else:
+        factory.listen(args.host, args.port)
+
+
+def serve(args, channel=None):
+    timers = TimingWheel(args.tick) if args.timers == 'wheel' else None
+    eventloop = EventLoop(timers)
+    options = dict(policy=args.policy, high_water=args.high_water)
+    if channel is None:
+        factory = Factory(eventloop, CommandProtocol, **options)
+    else:
+        factory = WorkerFactory(eventloop, CommandProtocol, channel, **options)
+    listen(factory, args)
+    if args.udp_port:
+        # workers share the UDP port the same way as the TCP one
+        DatagramServer(eventloop).listen(args.host, args.udp_port,
+                                         reuse_port=channel is not None)
+    if args.stats_interval or args.profile:
+        configure_logging('Server')
+    if args.stats_interval:
+        eventloop.call_later(args.stats_interval, dump, factory,
+                             args.stats_interval)
+    if args.profile:
+        Profiler(eventloop, args.slow_callback,
+                 args.sample_interval).install(signal.SIGUSR1)
+    eventloop.run()
+
+
+def serve_asyncio(args):
+    eventloop = AsyncioLoop()
+    factory = AsyncioFactory(eventloop, CommandProtocol, policy=args.policy,
+                             high_water=args.high_water)
+    listen(factory, args)
+    if args.profile:
+        # asyncio has its own slow callback logging
+        configure_logging('Server')
+        eventloop.loop.set_debug(True)
+        eventloop.loop.slow_callback_duration = args.slow_callback
+    try:
+        eventloop.run()
+    finally:
+        eventloop.close()
 
 
 if __name__ == '__main__':
     args = get_cmd_args()
-    eventloop = EventLoop()
-    factory = Factory(eventloop, CommandProtocol)
-    factory.listen(args.host, args.port)
-    eventloop.run()
\ No newline at end of file
+    if args.backend == 'asyncio':
+        if args.workers or args.udp_port:
+            raise SystemExit('-workers and -udp-port need the native '
+                             'backend')
+        serve_asyncio(args)
+    elif args.workers:
+        if args.unix:
+            # SO_REUSEPORT only spreads TCP and UDP listeners
+            raise SystemExit('-workers needs a TCP port')
+        Supervisor(args.workers, partial(serve, args)).run()
+    else:
+        serve(args)
\ No newline at end of file
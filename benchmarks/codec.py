@@ -0,0 +1,194 @@
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from work import models
+from work.fields import Int, Str
+from work.protocol import Packet, feed
+
+
+PAYLOAD = 32
+CHUNK_SIZES = (64, 1024, 65536)
+DEPTHS = (1, 16, 256)
+# metrics where a bigger number is a regression
+LOWER_IS_BETTER = ('blocks', 'bytes')
+
+
+def sample(cls, size=PAYLOAD):
+    kwargs = {name: 'x' * min(size, cls._fields[name].maxsize)
+              for name in cls._names
+              if isinstance(cls._fields[name], Str)}
+    kwargs.update((name, size) for name in cls._names
+                  if isinstance(cls._fields[name], Int))
+    return cls(**kwargs)
+
+
+def rate(func, count, repeat=5):
+    # best of several runs with the collector off, as timeit does
+    best = None
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            started = time.perf_counter()
+            for j in range(count):
+                func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    return count / best
+
+
+def allocations(func, count):
+    # blocks and bytes still held per call once the results are kept alive
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [func() for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    del kept
+    return (sum(stat.count_diff for stat in stats) / count,
+            sum(stat.size_diff for stat in stats) / count)
+
+
+def bench_packets(count, repeat):
+    for cmd, cls in sorted(Packet.__class__.packets.items()):
+        packet = sample(cls)
+        frame = packet.pack()
+        body = memoryview(frame)[4:]
+        unpack = lambda: Packet.unpack(body)
+        for name, func in (('pack', packet.pack), ('unpack', unpack)):
+            ops = rate(func, count, repeat)
+            blocks, size = allocations(func, count // 10 or 1)
+            yield '{} {}'.format(cls.__name__, name), {
+                'ops': ops, 'bytes_per_sec': ops * len(frame),
+                'blocks': blocks, 'bytes': size}
+
+
+def bench_fields(count, repeat):
+    cases = [('Int', Int, 123456), ('Str', Str, 'x' * PAYLOAD)]
+    for name, field, value in cases:
+        data = field.serialize(value)
+        for op, func in (('serialize', lambda: field.serialize(value)),
+                         ('deserialize', lambda: field.deserialize(data))):
+            ops = rate(func, count, repeat)
+            blocks, size = allocations(func, count // 10 or 1)
+            yield '{} {}'.format(name, op), {
+                'ops': ops, 'bytes_per_sec': ops * len(data),
+                'blocks': blocks, 'bytes': size}
+
+
+def batches(depth, frames):
+    kinds = [models.Ping(), models.PingD(data='x' * PAYLOAD),
+             models.Connected(session='s' * 56)]
+    stream = [kinds[i % len(kinds)].pack() for i in range(frames)]
+    return [b''.join(stream[i:i + depth]) for i in range(0, frames, depth)]
+
+
+def bench_feed(frames, repeat):
+    # a client writes depth frames at a time and the server reads at most
+    # chunk bytes of one write per recv
+    for depth in DEPTHS:
+        writes = batches(depth, frames)
+        total = sum(map(len, writes))
+        for chunk in CHUNK_SIZES:
+            chunks = [view[i:i + chunk]
+                      for view in map(memoryview, writes)
+                      for i in range(0, len(view), chunk)]
+
+            def run():
+                feeder = feed()
+                next(feeder)
+                received = 0
+                for piece in chunks:
+                    received += len(feeder.send(piece))
+                return received
+
+            decoded = run()
+            elapsed = 1 / rate(run, 1, repeat)
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            yield 'feed depth={} chunk={}'.format(depth, chunk), {
+                'ops': decoded / elapsed, 'bytes_per_sec': total / elapsed,
+                'peak_bytes': peak}
+
+
+def run(count, frames, repeat):
+    results = {}
+    for bench, arg in ((bench_packets, count), (bench_fields, count),
+                       (bench_feed, frames)):
+        results.update(bench(arg, repeat))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # relative changes, absolute ones against a zero baseline
+    regressions = []
+    for case, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            base = baseline.get(case, {}).get(metric)
+            if base is None:
+                continue
+            change = value / base - 1 if base else value
+            if metric in LOWER_IS_BETTER or metric.startswith('peak'):
+                worse = change > threshold
+            else:
+                worse = change < -threshold
+            if worse:
+                regressions.append((case, metric, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='codec')
+    parser.add_argument('-count', default=50000, type=int,
+                        help='calls per codec measurement')
+    parser.add_argument('-frames', default=100000, type=int,
+                        help='frames per feed measurement')
+    parser.add_argument('-repeat', default=5, type=int,
+                        help='runs per measurement, the best one counts')
+    # throughput depends on the machine, so no baseline is shipped: save
+    # one with -save before a change and -compare against it after
+    parser.add_argument('-save', default=None,
+                        help='write the results as a baseline file')
+    parser.add_argument('-compare', default=None,
+                        help='baseline file written by -save on this '
+                             'machine to check the results against')
+    parser.add_argument('-threshold', default=0.1, type=float,
+                        help='relative change reported as a regression')
+    args = parser.parse_args()
+
+    results = run(args.count, args.frames, args.repeat)
+    print('{:<36}{:>14}{:>14}{:>10}{:>10}'.format(
+        'case', 'ops/s', 'MB/s', 'blocks', 'bytes'))
+    for case, metrics in results.items():
+        print('{:<36}{:>14.0f}{:>14.1f}{:>10.1f}{:>10.0f}'.format(
+            case, metrics['ops'], metrics['bytes_per_sec'] / 1e6,
+            metrics.get('blocks', 0),
+            metrics.get('bytes', metrics.get('peak_bytes', 0))))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, metric, base, value, change in regressions:
+            shown = '{:+.0%}' if base else '{:+.2f}'
+            print('REGRESSION {} {}: {:.1f} -> {:.1f} ({})'.format(
+                case, metric, base, value, shown.format(change)))
+        if regressions:
+            sys.exit(1)
+        print('no regressions over {:.0%}'.format(args.threshold))
+
+
+if __name__ == '__main__':
+    main()
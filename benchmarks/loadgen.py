@@ -0,0 +1,400 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from bisect import bisect_left
+from functools import partial
+
+from work.loop import EventLoop
+from work.client import ClientPool, ReplyMatcher
+from work.protocol import feed
+from work.models import (cmd, Connect, Ping, PingD, Delay,
+                         Connected, Pong, PongD, Delayed)
+
+
+REPLIES = {Pong: 'ping', PongD: 'pingd', Connected: 'connect',
+           Delayed: 'delay'}
+REPLY_CMDS = {'ping': cmd.PONG, 'pingd': cmd.PONGD, 'connect': cmd.CONNECTED,
+              'delay': cmd.DELAYED}
+PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in REPLIES.values():
+            raise argparse.ArgumentTypeError('unknown command ' + kind)
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(',')]
+
+
+class Histogram:
+
+    # upper bounds in microseconds, powers of two up to about 67 seconds
+    BOUNDS = [2 ** i for i in range(27)]
+
+    def __init__(self):
+        self.samples = []
+
+    def add(self, latency):
+        self.samples.append(latency)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {'count': 0}
+        result = {'count': len(samples),
+                  'mean_ms': sum(samples) / len(samples) * 1e3,
+                  'max_ms': samples[-1] * 1e3}
+        for name, q in PERCENTILES:
+            index = min(int(q * len(samples)), len(samples) - 1)
+            result[name + '_ms'] = samples[index] * 1e3
+        buckets = [0] * len(self.BOUNDS)
+        for latency in samples:
+            index = bisect_left(self.BOUNDS, latency * 1e6)
+            buckets[min(index, len(buckets) - 1)] += 1
+        result['histogram_us'] = [[bound, n] for bound, n
+                                  in zip(self.BOUNDS, buckets) if n]
+        return result
+
+
+class Connection:
+
+    def __init__(self, generator, reader, writer):
+        self.generator = generator
+        self.reader = reader
+        self.writer = writer
+        self.replies = ReplyMatcher(generator.sessions)
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def send(self, kind, intended=None):
+        self.replies.expect(REPLY_CMDS[kind], intended or time.perf_counter())
+        self.generator.sent += 1
+        self.writer.write(self.generator.frame(kind))
+
+    async def read(self):
+        feeder = feed()
+        next(feeder)
+        generator, match = self.generator, self.replies.match
+        while True:
+            try:
+                data = await self.reader.read(65536)
+            except OSError:
+                data = None
+            if not data:
+                self.lost()
+                return
+            now = time.perf_counter()
+            for packet in feeder.send(data):
+                sent = match(packet)
+                if sent is ReplyMatcher.BROADCAST:
+                    generator.broadcasts += 1
+                elif sent is ReplyMatcher.UNEXPECTED:
+                    generator.unexpected += 1
+                else:
+                    generator.record(REPLIES[packet.__class__], now - sent)
+                    self.ready.set()
+
+    def lost(self):
+        # whatever is still in flight will never be answered
+        self.closed = True
+        self.generator.disconnected += 1
+        self.generator.failed += len(self.replies.clear())
+        self.ready.set()
+
+    async def closed_loop(self, depth, deadline):
+        choose = self.generator.choose
+        while not self.closed:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                return
+            while self.replies.inflight < depth:
+                self.send(choose())
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def probe(self):
+        self.send('connect')
+        while self.replies.session is None and not self.closed:
+            self.ready.clear()
+            await self.ready.wait()
+        if self.replies.session is not None:
+            self.generator.sessions.add(self.replies.session)
+
+
+class LoadGenerator:
+
+    CONNECT_CONCURRENCY = 64
+    CONNECT_RETRIES = 100
+
+    def __init__(self, host, port, mix, sizes, seed=0, unix=None):
+        self.host = host
+        self.port = port
+        self.unix = unix
+        self.random = random.Random(seed)
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.frames = {'ping': [Ping().pack()], 'connect': [Connect().pack()]}
+        for kind, cls in (('pingd', PingD), ('delay', Delay)):
+            self.frames[kind] = [cls(data='x' * size).pack()
+                                 for size in sizes]
+        self.connections = []
+        # learnt by probing, never taken for another connection's reply
+        self.sessions = set()
+        self.histograms = {kind: Histogram() for kind in self.kinds}
+        self.total = Histogram()
+        self.sent = self.received = 0
+        self.broadcasts = self.unexpected = 0
+        # requests lost with their connection, and the connections lost
+        self.failed = self.disconnected = 0
+
+    def choose(self):
+        return self.random.choices(self.kinds, self.weights)[0]
+
+    def frame(self, kind):
+        frames = self.frames[kind]
+        return frames[0] if len(frames) == 1 else self.random.choice(frames)
+
+    def record(self, kind, latency):
+        self.received += 1
+        self.histograms[kind].add(latency)
+        self.total.add(latency)
+
+    async def open_connection(self, limit):
+        async with limit:
+            for i in range(self.CONNECT_RETRIES):
+                try:
+                    if self.unix:
+                        reader, writer = await asyncio.open_unix_connection(
+                            self.unix)
+                    else:
+                        reader, writer = await asyncio.open_connection(
+                            self.host, self.port)
+                    break
+                except (ConnectionRefusedError, FileNotFoundError):
+                    if i == self.CONNECT_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(0.05)
+        connection = Connection(self, reader, writer)
+        self.connections.append(connection)
+        return connection
+
+    async def open_loop(self, rate, deadline):
+        # arrivals follow the schedule whatever the replies do, and latency
+        # counts from the intended send time, so queueing is not hidden
+        connections, choose = self.connections, self.choose
+        intended = time.perf_counter()
+        while intended < deadline:
+            intended += self.random.expovariate(rate)
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            connections = [connection for connection in connections
+                           if not connection.closed]
+            if not connections:
+                return
+            self.random.choice(connections).send(choose(), intended)
+
+    async def run(self, count, mode, depth, rate, duration, drain):
+        limit = asyncio.Semaphore(self.CONNECT_CONCURRENCY)
+        await asyncio.gather(*[self.open_connection(limit)
+                               for i in range(count)])
+        readers = [asyncio.ensure_future(connection.read())
+                   for connection in self.connections]
+        if 'connect' in self.kinds:
+            # learn every session one at a time, so own broadcasts are
+            # told apart from the other connections' ones
+            for connection in self.connections:
+                await connection.probe()
+            for histogram in [self.total] + list(self.histograms.values()):
+                histogram.samples.clear()
+            self.sent = self.received = self.broadcasts = 0
+            self.failed = 0
+
+        started = time.perf_counter()
+        deadline = started + duration
+        if mode == 'open':
+            await self.open_loop(rate, deadline)
+        else:
+            await asyncio.gather(*[connection.closed_loop(depth, deadline)
+                                   for connection in self.connections])
+        elapsed = time.perf_counter() - started
+
+        drain_deadline = time.perf_counter() + drain
+        while (self.received + self.failed < self.sent and
+               time.perf_counter() < drain_deadline):
+            await asyncio.sleep(0.01)
+        for connection in self.connections:
+            connection.writer.close()
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        return elapsed
+
+    def run_eventloop(self, count, depth, duration, drain):
+        # the same closed loop driven by work.client on the native loop
+        eventloop = EventLoop()
+        pool = ClientPool(eventloop, self.host, self.port, count,
+                          sessions='connect' in self.kinds, unix=self.unix)
+        pool.start()
+        while not pool.ready.done():
+            eventloop.run_once(0.1)
+        pool.ready.result()
+        connections = list(pool.connections)
+        broadcasts = sum(protocol.broadcasts for protocol in connections)
+
+        started = time.perf_counter()
+        deadline = started + duration
+        for protocol in pool.connections:
+            for i in range(depth):
+                self.send_on(eventloop, protocol, deadline)
+        eventloop.call_later(duration + drain, stop)
+        eventloop.run()
+        elapsed = min(time.perf_counter() - started, duration)
+
+        self.broadcasts = sum(protocol.broadcasts for protocol
+                              in pool.connections) - broadcasts
+        self.disconnected = sum(protocol.transport is None
+                                for protocol in connections)
+        pool.close()
+        eventloop.close()
+        return elapsed
+
+    def send_on(self, eventloop, protocol, deadline):
+        kind = self.choose()
+        self.sent += 1
+        future = protocol.send(self.frame(kind), REPLY_CMDS[kind])
+        future.add_done_callback(partial(self.completed, eventloop, protocol,
+                                         kind, time.perf_counter(), deadline))
+
+    def completed(self, eventloop, protocol, kind, sent, deadline, future):
+        if future.exception() is None:
+            self.record(kind, time.perf_counter() - sent)
+        else:
+            self.failed += 1
+        if time.perf_counter() < deadline:
+            if protocol.transport is not None:
+                self.send_on(eventloop, protocol, deadline)
+        elif self.received + self.failed >= self.sent:
+            eventloop.stop()
+
+    def report(self, elapsed, **settings):
+        result = dict(settings)
+        result.update(elapsed=elapsed, sent=self.sent, received=self.received,
+                      lost=self.sent - self.received, failed=self.failed,
+                      disconnected=self.disconnected,
+                      throughput=self.received / elapsed,
+                      broadcast_frames=self.broadcasts,
+                      unexpected=self.unexpected,
+                      latency=self.total.summary(),
+                      commands={kind: histogram.summary() for kind, histogram
+                                in self.histograms.items()})
+        return result
+
+
+def stop(eventloop):
+    eventloop.stop()
+
+
+def start_server(script, port, extra, unix=None):
+    address = ['-unix', unix] if unix else ['-port', str(port)]
+    return subprocess.Popen([sys.executable, script] + address + extra)
+
+
+def stop_server(server):
+    if server.poll() is None:
+        server.terminate()
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='loadgen')
+    parser.add_argument('-host', default='127.0.0.1', help='host')
+    parser.add_argument('-port', default=50007, type=int, help='port')
+    parser.add_argument('-unix', default=None,
+                        help='unix socket path, used instead of host and '
+                             'port')
+    parser.add_argument('-server', default=None,
+                        help='server script to start, e.g. async_server.py')
+    parser.add_argument('-server-args', default='',
+                        help='extra arguments for the started server')
+    parser.add_argument('-connections', default=1000, type=int,
+                        help='concurrent connections')
+    parser.add_argument('-mix', default='ping=70,pingd=20,delay=10',
+                        type=parse_mix,
+                        help='command weights, e.g. ping=70,pingd=20,'
+                             'connect=1,delay=9')
+    parser.add_argument('-sizes', default='16,64,256', type=parse_sizes,
+                        help='PINGD/DELAY payload sizes to pick from')
+    parser.add_argument('-mode', default='closed', choices=['closed', 'open'],
+                        help='closed: each connection keeps -depth requests '
+                             'in flight; open: Poisson arrivals at -rate')
+    parser.add_argument('-depth', default=1, type=int,
+                        help='pipelining depth per connection, closed loop')
+    parser.add_argument('-rate', default=10000.0, type=float,
+                        help='requests per second over all connections, '
+                             'open loop')
+    parser.add_argument('-duration', default=10.0, type=float,
+                        help='seconds of load')
+    parser.add_argument('-drain', default=2.0, type=float,
+                        help='seconds to wait for outstanding replies')
+    parser.add_argument('-engine', default='asyncio',
+                        choices=['asyncio', 'loop'],
+                        help='client side: asyncio streams or work.client '
+                             'on the native event loop, closed loop only')
+    parser.add_argument('-seed', default=0, type=int, help='random seed')
+    parser.add_argument('-output', default=None,
+                        help='JSON file, stdout by default')
+    args = parser.parse_args()
+    if args.engine == 'loop' and args.mode == 'open':
+        parser.error('-engine loop runs the closed loop only')
+
+    server = None
+    if args.server:
+        server = start_server(args.server, args.port,
+                              args.server_args.split(), args.unix)
+    try:
+        generator = LoadGenerator(args.host, args.port, args.mix, args.sizes,
+                                  args.seed, args.unix)
+        if args.engine == 'loop':
+            elapsed = generator.run_eventloop(args.connections, args.depth,
+                                              args.duration, args.drain)
+        else:
+            elapsed = asyncio.run(generator.run(
+                args.connections, args.mode, args.depth, args.rate,
+                args.duration, args.drain))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    result = generator.report(elapsed, server=args.server,
+                              engine=args.engine, mode=args.mode,
+                              connections=args.connections, depth=args.depth,
+                              rate=args.rate if args.mode == 'open' else None,
+                              mix=args.mix, sizes=args.sizes)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
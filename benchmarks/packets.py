@@ -0,0 +1,54 @@
+import timeit
+import argparse
+import tracemalloc
+
+from work.protocol import Packet
+from work.models import Ping, PingD, Connected
+
+
+CASES = [
+    ('Ping', lambda: Ping()),
+    ('PingD', lambda: PingD(data='test_data')),
+    ('Connected', lambda: Connected(session='x' * 56)),
+]
+
+
+def allocation_size(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    packets = [factory() for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del packets
+    return size / count
+
+
+def construction_time(factory, count):
+    return min(timeit.repeat(factory, number=count, repeat=5)) / count
+
+
+def run(count):
+    results = []
+    for name, factory in CASES:
+        body = memoryview(factory().pack())[4:]
+        decode = lambda: Packet.unpack(body)
+        results.append((name,
+                        allocation_size(factory, count),
+                        construction_time(factory, count) * 1e9,
+                        construction_time(decode, count) * 1e9))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='packets')
+    parser.add_argument('-count', default=100000, type=int,
+                        help='packets per measurement')
+    args = parser.parse_args()
+    print('{:<12}{:>14}{:>14}{:>14}'.format('packet', 'bytes/packet',
+                                            'init ns', 'unpack ns'))
+    for row in run(args.count):
+        print('{:<12}{:>14.1f}{:>14.1f}{:>14.1f}'.format(*row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import time
+import random
+import argparse
+
+from work.loop import TimeLoop
+from work.timers import HeapTimers, TimingWheel
+
+
+def callback(eventloop, value):
+    pass
+
+
+class Handler:
+
+    def method(self, eventloop, value):
+        pass
+
+
+def bench_call_soon(loop, count):
+    started = time.perf_counter()
+    for i in range(count):
+        loop.call_soon(callback, i)
+    scheduled = time.perf_counter()
+    loop.process_delayed_calls()
+    return scheduled - started, time.perf_counter() - scheduled
+
+
+def bench_call_later(loop, count):
+    rnd = random.Random(0)
+    delays = [rnd.uniform(0, 0.5) for i in range(count)]
+    method = Handler().method
+    started = time.perf_counter()
+    for delay in delays:
+        loop.call_later(delay, method, delay)
+    scheduled = time.perf_counter()
+    due = []
+    loop._later.pop_due(time.monotonic() + 1, due)
+    for dc in due:
+        dc()
+    return scheduled - started, time.perf_counter() - scheduled
+
+
+def run(count):
+    cases = [
+        ('call_soon', lambda: TimeLoop(), bench_call_soon),
+        ('call_later heap', lambda: TimeLoop(HeapTimers()), bench_call_later),
+        ('call_later wheel', lambda: TimeLoop(TimingWheel()),
+         bench_call_later),
+    ]
+    for name, create, bench in cases:
+        schedule, dispatch = min(bench(create(), count) for i in range(3))
+        yield name, count / schedule, count / dispatch
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='scheduling')
+    parser.add_argument('-count', default=100000, type=int,
+                        help='calls per measurement')
+    args = parser.parse_args()
+    print('{:<20}{:>16}{:>16}'.format('case', 'scheduled/s', 'dispatched/s'))
+    for row in run(args.count):
+        print('{:<20}{:>16.0f}{:>16.0f}'.format(*row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import socket
+import argparse
+import selectors
+import tempfile
+
+from work.utils import get_msg
+from work.models import Ping, Connect
+from benchmarks.loadgen import PERCENTILES, start_server, stop_server
+
+
+CONNECT_RETRIES = 200
+NAMES = {socket.AF_INET: 'tcp', socket.AF_UNIX: 'unix'}
+
+
+def connect(family, address):
+    for i in range(CONNECT_RETRIES):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            return sock
+        except (ConnectionRefusedError, FileNotFoundError):
+            sock.close()
+            time.sleep(0.05)
+    raise ConnectionRefusedError(address)
+
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('server closed the connection')
+        data += chunk
+    return data
+
+
+def summarize(latencies):
+    count = len(latencies)
+    latencies.sort()
+    result = {'mean_us': sum(latencies) / count * 1e6}
+    for name, q in PERCENTILES:
+        result[name + '_us'] = latencies[min(int(q * count), count - 1)] * 1e6
+    return result
+
+
+def bench_ping(family, address, count):
+    frame, size = Ping().pack(), len(Ping().reply())
+    latencies = []
+    with connect(family, address) as sock:
+        for i in range(count):
+            started = time.perf_counter()
+            sock.sendall(frame)
+            recv_exactly(sock, size)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_udp_ping(address, count):
+    frame = Ping().pack()
+    latencies = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(1)
+        for i in range(CONNECT_RETRIES):
+            # the server may still be starting up
+            sock.sendto(frame, address)
+            try:
+                sock.recv(64)
+                break
+            except socket.timeout:
+                pass
+        # blocking without a timeout, as the stream clients do
+        sock.settimeout(None)
+        for i in range(count):
+            started = time.perf_counter()
+            sock.sendto(frame, address)
+            sock.recv(64)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_broadcast(family, address, receivers, count):
+    socks = [connect(family, address) for i in range(receivers)]
+    try:
+        # a PONG each makes sure the server has accepted every one
+        for sock in socks:
+            sock.sendall(Ping().pack())
+            recv_exactly(sock, len(Ping().reply()))
+        socks[0].sendall(Connect().pack())
+        size = min(len(get_msg(sock)) for sock in socks) + 4
+
+        selector = selectors.DefaultSelector()
+        left = {}
+        for sock in socks:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+            left[sock] = size * count
+        started = time.perf_counter()
+        socks[0].sendall(Connect().pack() * count)
+        while left:
+            for key, events in selector.select(1):
+                sock = key.fileobj
+                try:
+                    received = len(sock.recv(256 * 1024))
+                except BlockingIOError:
+                    continue
+                left[sock] -= received
+                if not received or left[sock] <= 0:
+                    selector.unregister(sock)
+                    del left[sock]
+        elapsed = time.perf_counter() - started
+        selector.close()
+    finally:
+        for sock in socks:
+            sock.close()
+    frames = receivers * count
+    return {'frames_per_sec': frames / elapsed,
+            'mb_per_sec': frames * size / elapsed / 1e6}
+
+
+def run(args, family, address, extra):
+    results = {}
+    if family == socket.AF_UNIX:
+        server = start_server(args.server, None, extra, address)
+    else:
+        if args.udp:
+            extra = extra + ['-udp-port', str(address[1])]
+        server = start_server(args.server, address[1], extra)
+    try:
+        if args.udp and family != socket.AF_UNIX:
+            results['udp'] = {'ping': bench_udp_ping(address, args.count)}
+        results[NAMES[family]] = {
+            'ping': bench_ping(family, address, args.count),
+            'broadcast': bench_broadcast(family, address, args.receivers,
+                                         args.broadcasts)}
+    finally:
+        stop_server(server)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='transports')
+    parser.add_argument('-server', default='async_server.py',
+                        help='server script to start')
+    parser.add_argument('-server-args', default='',
+                        help='extra arguments for the started servers')
+    parser.add_argument('-port', default=50027, type=int,
+                        help='TCP loopback port')
+    parser.add_argument('-count', default=20000, type=int,
+                        help='sequential PING round trips')
+    parser.add_argument('-receivers', default=64, type=int,
+                        help='connections receiving the broadcasts')
+    parser.add_argument('-broadcasts', default=2000, type=int,
+                        help='CONNECT broadcasts sent by one connection')
+    parser.add_argument('-udp', action='store_true',
+                        help='also time PING datagrams, async_server only')
+    parser.add_argument('-output', default=None,
+                        help='JSON file for the results')
+    args = parser.parse_args()
+
+    extra = args.server_args.split()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'server.sock')
+        for family, address in ((socket.AF_INET, ('127.0.0.1', args.port)),
+                                (socket.AF_UNIX, path)):
+            results.update(run(args, family, address, extra))
+
+    print('{:<8}{:>10}{:>10}{:>10}{:>16}{:>10}'.format(
+        'socket', 'mean us', 'p50 us', 'p99 us', 'broadcast/s', 'MB/s'))
+    for name, result in results.items():
+        ping = result['ping']
+        line = '{:<8}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+            name, ping['mean_us'], ping['p50_us'], ping['p99_us'])
+        broadcast = result.get('broadcast')
+        if broadcast:
+            line += '{:>16.0f}{:>10.1f}'.format(broadcast['frames_per_sec'],
+                                                broadcast['mb_per_sec'])
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 import os
+import sys
+import time
 import signal
 import socket
 import logging
 
 from work.protocol import feed, Packet
+from work.client import ReplyMatcher
 from work.models import cmd, Connected, AckQuit, AckFinish
 from work.utils import configure_logging, packet_from_code
 from work.cmdargs import get_cmd_args
@@ -19,20 +22,29 @@ class CommandClient:
     session_id = None
     TIMEOUT = 10.0
     CHUNK_SIZE = 1024
+    BATCH_CHUNK_SIZE = 64 * 1024
+    WINDOW = 64
+    PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('max', 1))
     commands = [cmd.CONNECTED, cmd.PONG, cmd.PONGD, cmd.DELAYED,
-                cmd.ACKQUIT, cmd.ACKFINISH]
+                cmd.ACKQUIT, cmd.ACKFINISH, cmd.STATSREPLY]
+    # answered with a session, like the broadcasts of the other clients
+    SESSION_COMMANDS = (cmd.CONNECT, cmd.QUIT, cmd.FINISH)
 
-    def __init__(self, host, port):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def __init__(self, host, port, unix=None):
+        family = socket.AF_UNIX if unix else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
         self.socket.settimeout(self.TIMEOUT)
-        self.socket.connect((host, port))
+        self.socket.connect(unix or (host, port))
 
     @classmethod
-    def run_client(cls, host, port):
-        client = cls(host, port)
+    def run_client(cls, host, port, batch=None, window=WINDOW, unix=None):
+        client = cls(host, port, unix)
         handler = signal.signal(signal.SIGINT, shutdown_handler)
         try:
-            client.run()
+            if batch is None:
+                client.run()
+            else:
+                client.run_batch(batch, window)
         except (OSError, ClientFinishException):
             client.shutdown()
         finally:
@@ -43,17 +55,99 @@ class CommandClient:
         self.feeder.send(None)
         while True:
             print('Ender command: \n1 - CONNECT;\n2 - PING;\n3 <data> - PINGD;'
-                  '\n4 <data> - DELAY;\n5 - QUIT;\n6 - FINISH.\n')
+                  '\n4 <data> - DELAY;\n5 - QUIT;\n6 - FINISH;'
+                  '\n14 - STATS.\n')
             result = input().split()
             packet = packet_from_code(result)
             self.socket.sendall(packet.pack())
             self.recv_response()
 
-    def recv_response(self, packet=None):
-        while not packet:
-            packet = self.feeder.send(self.socket.recv(self.CHUNK_SIZE))
+    def run_batch(self, lines, window=WINDOW):
+        # keep up to window commands in flight, replies come back in order
+        # per reply type, DELAYED ones overtake
+        self.feeder = feed()
+        self.feeder.send(None)
+        commands = (packet_from_code(line.split()) for line in lines
+                    if line.strip() and not line.startswith('#'))
+        self.replies = ReplyMatcher()
+        self.latencies = {}
+        self.sent = self.received = self.broadcasts = self.unexpected = 0
+        started = time.perf_counter()
+        more, held, probing = True, None, False
+        while more or self.sent > self.received:
+            frames = []
+            while (more and not probing and
+                   self.sent - self.received + len(frames) < window):
+                packet, held = held or next(commands, None), None
+                if packet is None:
+                    more = False
+                    break
+                if (self.session_id is None and
+                        packet.cmd in self.SESSION_COMMANDS):
+                    # until the session is known such a command goes out
+                    # alone, so its reply is the only one we wait for
+                    if frames or self.sent > self.received:
+                        held = packet
+                        break
+                    probing = True
+                frames.append(packet)
+                # nothing after these gets an answer
+                more = packet.cmd not in (cmd.QUIT, cmd.FINISH)
+            if frames:
+                now = time.perf_counter()
+                for packet in frames:
+                    self.replies.expect(cmd.REPLIES[packet.cmd],
+                                        (self.sent, now))
+                    self.sent += 1
+                self.socket.sendall(b''.join(packet.pack()
+                                             for packet in frames))
+            if self.sent > self.received:
+                data = self.socket.recv(self.BATCH_CHUNK_SIZE)
+                if not data:
+                    break
+                self.match(self.feeder.send(data))
+            probing = probing and self.sent > self.received
+        self.report(time.perf_counter() - started)
+        self.socket.close()
 
-        getattr(self, packet.__class__.__name__.lower())(packet)
+    def match(self, packets):
+        now = time.perf_counter()
+        for packet in packets:
+            waiter = self.replies.match(packet)
+            if waiter is ReplyMatcher.BROADCAST:
+                self.broadcasts += 1
+                continue
+            if waiter is ReplyMatcher.UNEXPECTED:
+                self.unexpected += 1
+                continue
+            self.session_id = self.replies.session
+            index, sent = waiter
+            latency = now - sent
+            self.latencies.setdefault(packet.__class__.__name__,
+                                      []).append(latency)
+            self.received += 1
+            print('{} {} {:.3f} ms'.format(index, packet.cmd, latency * 1e3))
+
+    def report(self, elapsed):
+        print('sent {} received {} lost {} broadcasts {} unexpected {}'.format(
+            self.sent, self.received, self.sent - self.received,
+            self.broadcasts, self.unexpected))
+        print('{:.3f} s, {:.0f} commands/s'.format(
+            elapsed, self.received / elapsed if elapsed else 0))
+        for name, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            print(name, len(latencies), ' '.join(
+                '{} {:.3f} ms'.format(label, latencies[
+                    min(int(q * len(latencies)), len(latencies) - 1)] * 1e3)
+                for label, q in self.PERCENTILES))
+
+    def recv_response(self):
+        packets = []
+        while not packets:
+            packets = self.feeder.send(self.socket.recv(self.CHUNK_SIZE))
+
+        for packet in packets:
+            getattr(self, packet.__class__.__name__.lower())(packet)
 
     def connected(self, packet):
         self.session = packet.session
@@ -68,6 +162,9 @@ class CommandClient:
     def delayed(self, packet):
         print('{} {}'.format(packet.cmd, packet.data))
 
+    def statsreply(self, packet):
+        print('{} {}'.format(packet.cmd, packet.data))
+
     def ackquit(self, packet):
         print('{} {}'.format(packet.cmd, packet.session))
         self.shutdown()
@@ -85,4 +182,10 @@ class CommandClient:
 if __name__ == '__main__':
     configure_logging('Client')
     args = get_cmd_args()
-    CommandClient.run_client(args.host, args.port)
\ No newline at end of file
+    batch = None
+    if args.batch == '-':
+        batch = sys.stdin
+    elif args.batch:
+        batch = open(args.batch)
+    CommandClient.run_client(args.host, args.port, batch, args.window,
+                             args.unix)
\ No newline at end of file
@@ -1,20 +1,27 @@
 import os
+import json
+import time
 import os.path
 import socket
 import signal
 import logging
+import selectors
 import threading
+from itertools import count
 from operator import attrgetter
-from collections import namedtuple
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
 
 from work.protocol import feed
-from work.models import cmd
+from work.models import cmd, replies
 from work.cmdargs import get_cmd_args
+from work.timers import TimerThread
 from work.exceptions import ServerFinishException
 from work.utils import (get_random_hash,
                         handle_timeout,
                         get_keyword_args,
-                        configure_logging)
+                        configure_logging,
+                        unlink_socket)
 
 
 def shutdown_handler(signum, frame):
@@ -26,21 +33,35 @@ class CommandServer:
     MAX_CONN = 5
     TIMEOUT = 1.0
     CHUNK_SIZE = 1024
+    DELAY = 1.0
+    # how long the timer thread waits for a client another thread writes to
+    SEND_TIMEOUT = 0.1
     clients = {}
-    commands = [cmd.CONNECT, cmd.PING, cmd.PINGD, cmd.QUIT, cmd.FINISH]
-    templ = namedtuple('templ', 'addr, thread, session')
+    commands = [cmd.CONNECT, cmd.PING, cmd.PINGD, cmd.DELAY, cmd.QUIT,
+                cmd.FINISH, cmd.STATS]
+    templ = namedtuple('templ',
+                       'addr, thread, session, lock, delayed, feeder')
 
-    def __init__(self, host, port):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def __init__(self, host, port, backlog=MAX_CONN, unix=None):
+        self.timer = TimerThread()
+        self.timer.start()
+        self.delayed_ids = count()
+        self.unix = unix
+        family = socket.AF_UNIX if unix else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.settimeout(self.TIMEOUT)
-        self.socket.bind((host, port))
-        self.socket.listen(self.MAX_CONN)
+        if unix:
+            unlink_socket(unix)
+            self.socket.bind(unix)
+        else:
+            self.socket.bind((host, port))
+        self.socket.listen(backlog)
 
     @classmethod
-    def run_server(cls, host, port):
+    def run_server(cls, host, port, **kwargs):
         handler = signal.signal(signal.SIGINT, shutdown_handler)
-        server = cls(host, port)
+        server = cls(host, port, **kwargs)
         try:
             server.run()
         except (ServerFinishException, OSError):
@@ -53,44 +74,122 @@ class CommandServer:
             with handle_timeout():
                 conn, addr = self.socket.accept()
                 th = threading.Thread(target=self.run_client, args=(conn, ))
-                self.clients[conn] = self.templ(addr=addr, thread=th,
-                                                session=get_random_hash())
+                self.add_client(conn, addr, th)
                 th.start()
 
-    def run_client(self, conn):
+    def add_client(self, conn, addr, thread=None):
         feeder = feed()
-        packet = next(feeder)
-        while True:
-            try:
-                while packet is None:
-                    packet = feeder.send(conn.recv(self.CHUNK_SIZE))
+        next(feeder)
+        self.clients[conn] = self.templ(addr=addr, thread=thread,
+                                        session=get_random_hash(),
+                                        lock=threading.Lock(),
+                                        delayed={}, feeder=feeder)
+
+    def run_client(self, conn):
+        while self.serve_client(conn):
+            pass
+
+    def serve_client(self, conn):
+        try:
+            data = conn.recv(self.CHUNK_SIZE)
+            if not data:
+                raise ConnectionResetError()
+            for packet in self.clients[conn].feeder.send(data):
                 getattr(self, packet.__class__.__name__.lower())(packet, conn)
-            except OSError:
-                conn.close()
-                self.clients.pop(conn, None)
-                return
-            finally:
-                packet = None
+        except (OSError, KeyError):
+            self.close_client(conn)
+            return False
+        except Exception:
+            # an unexpected packet, or a bug, costs only this connection
+            logging.exception('closing client %s',
+                              getattr(self.clients.get(conn), 'addr', None))
+            self.close_client(conn)
+            return False
+        return True
+
+    def close_client(self, conn):
+        # forgotten before the peer can see EOF
+        client = self.clients.pop(conn, None)
+        conn.close()
+        if client is not None:
+            replies.evict(client.session)
+            for dc in list(client.delayed.values()):
+                dc.cancel()
+
+    def send(self, conn, data):
+        client = self.clients.get(conn)
+        if client is None:
+            return
+        with client.lock:
+            conn.sendall(data)
 
     def send_to_all(self, packet, conn):
         session = self.clients[conn].session
-        reply = packet.reply(session)
-        for client in list(self.clients.keys()):
-            client.sendall(reply)
+        self.broadcast(packet.reply(session), conn)
+
+    def broadcast(self, reply, sender):
+        self.send_each(reply, list(self.clients.keys()))
+
+    def send_each(self, reply, clients):
+        for client in clients:
+            try:
+                self.send(client, reply)
+            except OSError:
+                pass
 
     def connect(self, packet, conn):
         self.send_to_all(packet, conn)
 
     def ping(self, packet, conn):
-        conn.sendall(packet.reply())
+        self.send(conn, packet.reply())
 
     def pingd(self, packet, conn):
-        conn.sendall(packet.reply())
+        self.send(conn, packet.reply())
+
+    def delay(self, packet, conn):
+        key = next(self.delayed_ids)
+        self.clients[conn].delayed[key] = self.timer.call_later(
+            self.DELAY, self.send_delayed, conn, key, packet.reply())
+
+    def send_delayed(self, timer, conn, key, data):
+        # one timer thread serves every client, so it never blocks on a
+        # full buffer: a client that does not read is dropped instead
+        client = self.clients.get(conn)
+        if client is None:
+            return
+        client.delayed.pop(key, None)
+        if not client.lock.acquire(timeout=self.SEND_TIMEOUT):
+            self.drop_client(conn)
+            return
+        try:
+            sent = conn.send(data, socket.MSG_DONTWAIT)
+        except OSError:
+            sent = 0
+        finally:
+            client.lock.release()
+        if sent < len(data):
+            self.drop_client(conn)
+
+    def drop_client(self, conn):
+        # the thread serving it reads EOF and closes it
+        logging.warning('dropping client %s, it does not read',
+                        getattr(self.clients.get(conn), 'addr', None))
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stats(self, packet, conn):
+        self.send(conn, packet.reply(json.dumps(self.snapshot())))
+
+    def snapshot(self):
+        return {'clients': len(self.clients),
+                'threads': threading.active_count(),
+                'replies': replies.stats()}
 
     def quit(self, packet, conn):
         self.send_to_all(packet, conn)
-        conn.close()
-        self.clients.pop(conn, None)
+        self.close_client(conn)
         raise SystemExit()
 
     def finish(self, packet, conn):
@@ -99,18 +198,136 @@ class CommandServer:
         raise SystemExit()
 
     def shutdown(self):
+        self.timer.stop()
         self.socket.close()
+        if self.unix:
+            unlink_socket(self.unix)
         logging.info('socket closed')
         for conn in list(self.clients.keys()):
             conn.close()
         logging.info('connections closed')
-        for th in map(attrgetter('thread'), list(self.clients.values())):
-            th.join()
+        self.join()
         logging.info('threads closed')
         raise SystemExit()
 
+    def join(self):
+        for th in map(attrgetter('thread'), list(self.clients.values())):
+            th.join()
+
+
+class PooledCommandServer(CommandServer):
+
+    POOL_SIZE = 8
+
+    def __init__(self, host, port, backlog=CommandServer.MAX_CONN,
+                 pool_size=POOL_SIZE, unix=None):
+        super().__init__(host, port, backlog, unix)
+        self.pool = ThreadPoolExecutor(pool_size)
+        # a reader too slow for a broadcast stalls this thread, never
+        # the workers
+        self.broadcaster = ThreadPoolExecutor(1)
+        self.selector = selectors.DefaultSelector()
+        self.rearmed = deque()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.pool_lock = threading.Lock()
+        self.pool_stats = dict.fromkeys(('dispatched', 'queued',
+                                         'queued_max'), 0)
+        self.pool_stats.update(wait_time=0.0, wait_max=0.0)
+
+    def run(self):
+        # one thread watches every socket, a client is handed to the pool
+        # when readable and watched again once its handler returns
+        selector = self.selector
+        selector.register(self.socket, selectors.EVENT_READ)
+        selector.register(self.wakeup_r, selectors.EVENT_READ)
+        while True:
+            for key, events in selector.select(self.TIMEOUT):
+                sock = key.fileobj
+                if sock is self.socket:
+                    self.accept()
+                elif sock is self.wakeup_r:
+                    self.rearm()
+                else:
+                    selector.unregister(sock)
+                    self.dispatch(sock)
+
+    def accept(self):
+        with handle_timeout():
+            conn, addr = self.socket.accept()
+            self.add_client(conn, addr)
+            self.selector.register(conn, selectors.EVENT_READ)
+
+    def dispatch(self, conn):
+        stats = self.pool_stats
+        with self.pool_lock:
+            stats['dispatched'] += 1
+            stats['queued'] += 1
+            if stats['queued'] > stats['queued_max']:
+                stats['queued_max'] = stats['queued']
+        self.pool.submit(self.run_task, conn, time.monotonic())
+
+    def run_task(self, conn, submitted):
+        waited = time.monotonic() - submitted
+        stats = self.pool_stats
+        with self.pool_lock:
+            stats['queued'] -= 1
+            stats['wait_time'] += waited
+            if waited > stats['wait_max']:
+                stats['wait_max'] = waited
+        try:
+            alive = self.serve_client(conn)
+        except SystemExit:
+            alive = False
+        if alive:
+            self.rearmed.append(conn)
+            try:
+                self.wakeup_w.send(b'\0')
+            except BlockingIOError:
+                pass
+
+    def broadcast(self, reply, sender):
+        # the sender gets its reply before its handler returns, so a QUIT
+        # is acknowledged before the connection closes
+        self.send_each(reply, [sender])
+        others = [client for client in list(self.clients.keys())
+                  if client is not sender]
+        self.broadcaster.submit(self.send_each, reply, others)
+
+    def rearm(self):
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.rearmed:
+            conn = self.rearmed.popleft()
+            if conn in self.clients and conn.fileno() != -1:
+                self.selector.register(conn, selectors.EVENT_READ)
+
+    def snapshot(self):
+        result = super().snapshot()
+        with self.pool_lock:
+            result['pool'] = dict(self.pool_stats)
+        return result
+
+    def join(self):
+        self.pool.shutdown(wait=True)
+        self.broadcaster.shutdown(wait=True)
+        self.selector.close()
+        self.wakeup_r.close()
+        self.wakeup_w.close()
+        logging.info('pool stats %s', self.pool_stats)
+
 
 if __name__ == '__main__':
     configure_logging('Server')
     args = get_cmd_args()
-    CommandServer.run_server(args.host, args.port)
\ No newline at end of file
+    if args.pool:
+        PooledCommandServer.run_server(args.host, args.port,
+                                       backlog=args.backlog,
+                                       pool_size=args.pool, unix=args.unix)
+    else:
+        CommandServer.run_server(args.host, args.port, backlog=args.backlog,
+                                 unix=args.unix)
\ No newline at end of file
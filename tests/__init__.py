@@ -1,2 +1,18 @@
-from .test_server import ServerTestCase
+from .test_server import (ServerTestCase, PooledServerTestCase,
+                          AsyncServerTestCase, WheelAsyncServerTestCase,
+                          AsyncioServerTestCase)
 from .test_command import CommandTestCase
+from .test_protocol import FeedTestCase
+from .test_layer import TransportTestCase, FactoryTestCase
+from .test_loop import (HeapTimersTestCase, TimingWheelTestCase,
+                        TimerThreadTestCase, DelayedCallTestCase,
+                        EventLoopTestCase, ExecutorTestCase)
+from .test_workers import (ChannelTestCase, SupervisorTestCase,
+                           WorkersServerTestCase)
+from .test_aio import AsyncioFactoryTestCase
+from .test_metrics import (HistogramTestCase, LoopMetricsTestCase,
+                           StatsTestCase)
+from .test_profiler import ProfilerTestCase
+from .test_client import (BatchClientTestCase, UnixBatchClientTestCase,
+                          ReplyMatcherTestCase, ClientPoolTestCase)
+from .test_datagram import DatagramServerTestCase
@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import unittest
+import tempfile
+
+from work.protocol import feed
+from work.models import (Connected, Pong, Delayed, StatsReply, Connect, Ping,
+                         Delay, Stats)
+from work.aio import AsyncioLoop, AsyncioFactory
+from async_server import CommandProtocol
+
+
+class AsyncioFactoryTestCase(unittest.TestCase):
+
+    TIMEOUT = 2
+
+    def setUp(self):
+        self.eventloop = AsyncioLoop()
+        self.addCleanup(self.eventloop.close)
+        self.factory = AsyncioFactory(self.eventloop, CommandProtocol)
+        self.factory.listen('127.0.0.1', 0)
+        self.addCleanup(self.factory.server.close)
+        self.port = self.factory.server.sockets[0].getsockname()[1]
+
+    def run_until_complete(self, coro):
+        loop = self.eventloop.loop
+        return loop.run_until_complete(asyncio.wait_for(coro, self.TIMEOUT))
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+        feeder = feed()
+        next(feeder)
+        return reader, writer, feeder
+
+    async def receive(self, reader, feeder):
+        while True:
+            packets = feeder.send(await reader.read(4096))
+            if packets:
+                return packets
+
+    def test_ping(self):
+        async def ping():
+            reader, writer, feeder = await self.connect()
+            writer.write(Ping().pack())
+            return await self.receive(reader, feeder)
+
+        packets = self.run_until_complete(ping())
+        self.assertEqual([type(packet) for packet in packets], [Pong])
+
+    def test_unix(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'server.sock')
+        factory = AsyncioFactory(self.eventloop, CommandProtocol)
+        factory.listen_unix(path)
+
+        async def ping():
+            reader, writer = await asyncio.open_unix_connection(path)
+            self.addCleanup(writer.close)
+            feeder = feed()
+            next(feeder)
+            writer.write(Ping().pack())
+            return await self.receive(reader, feeder)
+
+        packets = self.run_until_complete(ping())
+        self.assertEqual([type(packet) for packet in packets], [Pong])
+        factory.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_broadcast(self):
+        async def broadcast():
+            first = await self.connect()
+            second = await self.connect()
+            while len(self.factory.clients) < 2:
+                await asyncio.sleep(0.01)
+            first[1].write(Connect().pack())
+            return [await self.receive(reader, feeder)
+                    for reader, writer, feeder in (first, second)]
+
+        for packets in self.run_until_complete(broadcast()):
+            self.assertIsInstance(packets[0], Connected)
+        self.assertEqual(self.factory.stats['frames'], 2)
+
+    def test_delay(self):
+        self.addCleanup(setattr, CommandProtocol, 'DELAY',
+                        CommandProtocol.DELAY)
+        CommandProtocol.DELAY = 0.05
+
+        async def delay():
+            reader, writer, feeder = await self.connect()
+            writer.write(Delay(data='data').pack())
+            return await self.receive(reader, feeder)
+
+        packets = self.run_until_complete(delay())
+        self.assertIsInstance(packets[0], Delayed)
+        self.assertEqual(packets[0].data, 'data')
+
+    def test_stats(self):
+        async def stats():
+            reader, writer, feeder = await self.connect()
+            writer.write(Stats().pack())
+            return await self.receive(reader, feeder)
+
+        reply, = self.run_until_complete(stats())
+        self.assertIsInstance(reply, StatsReply)
+        result = json.loads(reply.data)
+        self.assertEqual(result['connection']['frames_in'], 1)
+        self.assertEqual(result['factory']['clients'], 1)
+
+    def test_connection_lost(self):
+        async def disconnect():
+            reader, writer, feeder = await self.connect()
+            while not self.factory.clients:
+                await asyncio.sleep(0.01)
+            protocol, = self.factory.clients.values()
+            writer.write(Delay(data='data').pack())
+            while not protocol.delayed:
+                await asyncio.sleep(0.01)
+            handle, = protocol.delayed.values()
+            writer.close()
+            while self.factory.clients:
+                await asyncio.sleep(0.01)
+            return protocol, handle
+
+        protocol, handle = self.run_until_complete(disconnect())
+        self.assertIsNone(protocol.transport)
+        self.assertTrue(handle.cancelled())
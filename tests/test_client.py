@@ -0,0 +1,247 @@
+import io
+import os
+import json
+import time
+import signal
+import socket
+import unittest
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+
+from work.loop import EventLoop
+from work.layer import Factory
+from work.client import ClientPool, ReplyMatcher
+from work.protocol import feed
+from work.models import cmd, Connected, Pong, PongD, Ping, PingD, Stats
+from sync_client import CommandClient
+from async_server import CommandProtocol
+
+
+class BatchClientTestCase(unittest.TestCase):
+
+    HOST = 'localhost'
+    PORT = 50007
+    unix = None
+
+    def setUp(self):
+        args = ['-unix', self.unix] if self.unix else []
+        self.server = subprocess.Popen(['python3.3', 'sync_server.py'] + args)
+        self.addCleanup(self.stop_server)
+        while True:
+            try:
+                self.client = CommandClient(self.HOST, self.PORT, self.unix)
+            except (ConnectionRefusedError, FileNotFoundError):
+                time.sleep(0.01)
+            else:
+                break
+        self.addCleanup(self.client.socket.close)
+
+    def stop_server(self):
+        if self.server.poll() is None:
+            os.kill(self.server.pid, signal.SIGINT)
+        self.server.wait()
+
+    def run_batch(self, lines, window):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.client.run_batch(lines, window)
+        return output.getvalue().splitlines()
+
+    def test_batch(self):
+        lines = ['1', '# comment', '2', '3 data', '4 later', '', '2', '2']
+        output = self.run_batch(lines, window=2)
+        replies = [line.split()[:2] for line in output[:6]]
+        self.assertEqual(sorted(replies), [
+            ['0', str(cmd.CONNECTED)], ['1', str(cmd.PONG)],
+            ['2', str(cmd.PONGD)], ['3', str(cmd.DELAYED)],
+            ['4', str(cmd.PONG)], ['5', str(cmd.PONG)]])
+        # the delayed reply is overtaken but still matched to its command
+        self.assertEqual(replies[-1], ['3', str(cmd.DELAYED)])
+        self.assertEqual(output[6], 'sent 6 received 6 lost 0 '
+                                    'broadcasts 0 unexpected 0')
+        self.assertIsNotNone(self.client.session_id)
+        self.assertEqual(len(self.client.latencies['Pong']), 3)
+
+    def test_session_first(self):
+        inflight = []
+        match = self.client.match
+
+        def record(packets):
+            inflight.append(self.client.sent - self.client.received)
+            match(packets)
+
+        self.client.match = record
+        output = self.run_batch(['2', '1', '2', '2'], window=4)
+        # the PING is answered before the CONNECT goes out on its own
+        self.assertEqual(inflight[:2], [1, 1])
+        self.assertEqual([line.split()[:2] for line in output[:4]], [
+            ['0', str(cmd.PONG)], ['1', str(cmd.CONNECTED)],
+            ['2', str(cmd.PONG)], ['3', str(cmd.PONG)]])
+
+    def test_window(self):
+        output = self.run_batch(['2'] * 500, window=50)
+        self.assertIn('sent 500 received 500 lost 0', output[500])
+        self.assertEqual([int(line.split()[0]) for line in output[:500]],
+                         list(range(500)))
+
+    def test_quit(self):
+        output = self.run_batch(['1', '5', '2'], window=1)
+        self.assertEqual(output[1].split()[:2], ['1', str(cmd.ACKQUIT)])
+        self.assertIn('sent 2 received 2 lost 0', output[2])
+
+    def test_stats(self):
+        self.client.feeder = feed()
+        next(self.client.feeder)
+        self.client.socket.sendall(Stats().pack())
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.client.recv_response()
+        code, data = output.getvalue().split(' ', 1)
+        self.assertEqual(int(code), cmd.STATSREPLY)
+        self.assertEqual(json.loads(data)['clients'], 1)
+
+
+class UnixBatchClientTestCase(BatchClientTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.unix = os.path.join(directory.name, 'server.sock')
+        super().setUp()
+
+
+class ReplyMatcherTestCase(unittest.TestCase):
+
+    def test_match(self):
+        replies = ReplyMatcher()
+        replies.expect(cmd.PONG, 'first')
+        replies.expect(cmd.PONGD, 'data')
+        replies.expect(cmd.PONG, 'second')
+        self.assertEqual(replies.match(PongD(data='x')), 'data')
+        self.assertEqual(replies.match(Pong()), 'first')
+        self.assertEqual(replies.match(Pong()), 'second')
+        self.assertIs(replies.match(Pong()), ReplyMatcher.UNEXPECTED)
+        self.assertEqual(replies.inflight, 0)
+
+    def test_session(self):
+        replies = ReplyMatcher(claimed={'claimed'})
+        # nobody waits yet, so it is somebody else's
+        self.assertIs(replies.match(Connected(session='early')),
+                      ReplyMatcher.BROADCAST)
+        replies.expect(cmd.CONNECTED, 'connect')
+        self.assertIs(replies.match(Connected(session='claimed')),
+                      ReplyMatcher.BROADCAST)
+        self.assertEqual(replies.match(Connected(session='ours')), 'connect')
+        self.assertEqual(replies.session, 'ours')
+        replies.expect(cmd.CONNECTED, 'again')
+        self.assertIs(replies.match(Connected(session='other')),
+                      ReplyMatcher.BROADCAST)
+        self.assertEqual(replies.clear(), ['again'])
+        self.assertEqual(replies.inflight, 0)
+
+
+def stop(eventloop):
+    eventloop.stop()
+
+
+class ClientPoolTestCase(unittest.TestCase):
+
+    TIMEOUT = 2
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.addCleanup(self.eventloop.close)
+        self.server = Factory(self.eventloop, CommandProtocol)
+        self.server.listen('127.0.0.1', 0)
+        self.addCleanup(self.server.close)
+        self.port = self.server.socket.getsockname()[1]
+
+    def create_pool(self, size, **kwargs):
+        pool = ClientPool(self.eventloop, '127.0.0.1', self.port, size,
+                          **kwargs)
+        self.addCleanup(pool.close)
+        pool.start()
+        return pool
+
+    def run_until(self, done):
+        deadline = time.monotonic() + self.TIMEOUT
+        while not done():
+            self.assertLess(time.monotonic(), deadline)
+            self.eventloop.run_once(0.01)
+
+    def test_request(self):
+        pool = self.create_pool(3)
+        self.run_until(pool.ready.done)
+        self.assertIs(pool.ready.result(), pool)
+        futures = [pool.request(Ping()) for i in range(3)]
+        futures.append(pool.request(PingD(data='data')))
+        self.run_until(lambda: all(future.done() for future in futures))
+        self.assertEqual([type(future.result()) for future in futures],
+                         [Pong, Pong, Pong, PongD])
+        self.assertEqual(futures[-1].result().data, 'data')
+        self.assertEqual(len(self.server.clients), 3)
+        self.assertEqual(sum(protocol.inflight
+                             for protocol in pool.connections), 0)
+
+    def test_sessions(self):
+        pool = self.create_pool(3, sessions=True)
+        self.run_until(pool.ready.done)
+        sessions = {protocol.session for protocol in pool.connections}
+        self.assertEqual(sessions, {protocol.session for protocol
+                                    in self.server.clients.values()})
+        # every CONNECT reply reaches at least the sessions before it
+        self.run_until(lambda: sum(protocol.broadcasts for protocol
+                                   in pool.connections) >= 3)
+
+    def test_reconnect(self):
+        pool = self.create_pool(1)
+        self.run_until(pool.ready.done)
+        pending = pool.request(Ping())
+        for protocol in list(self.server.clients.values()):
+            protocol.connection_lost()
+        self.run_until(pending.done)
+        self.assertIsInstance(pending.exception(), ConnectionError)
+        self.run_until(lambda: pool.connections)
+        future = pool.request(Ping())
+        self.run_until(future.done)
+        self.assertIsInstance(future.result(), Pong)
+
+    def test_refused(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        pool = self.create_pool(1, reconnect=False)
+        self.run_until(pool.ready.done)
+        self.assertIsInstance(pool.ready.exception(), ConnectionRefusedError)
+        future = pool.request(Ping())
+        self.assertIsInstance(future.exception(), ConnectionError)
+
+    def test_unix(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'server.sock')
+        server = Factory(self.eventloop, CommandProtocol)
+        server.listen_unix(path)
+        self.addCleanup(server.close)
+        pool = ClientPool(self.eventloop, None, None, 2, unix=path)
+        self.addCleanup(pool.close)
+        pool.start()
+        self.run_until(pool.ready.done)
+        future = pool.request(PingD(data='unix'))
+        self.run_until(future.done)
+        self.assertEqual(future.result().data, 'unix')
+        self.assertEqual(len(server.clients), 2)
+
+    def test_threadsafe(self):
+        pool = self.create_pool(2)
+        thread = threading.Thread(target=self.eventloop.run)
+        thread.start()
+        try:
+            self.assertIs(pool.ready.result(self.TIMEOUT), pool)
+            future = pool.request_threadsafe(PingD(data='thread'))
+            self.assertEqual(future.result(self.TIMEOUT).data, 'thread')
+        finally:
+            self.eventloop.call_soon_threadsafe(stop)
+            thread.join()
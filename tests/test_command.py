@@ -1,10 +1,10 @@
 import unittest
 
-from work.protocol import Packet
+from work.protocol import Packet, ReplyCache
 from work.models import (cmd, Connected, Pong, PongD, AckQuit, AckFinish,
                          Connect, Ping, PingD, Quit, Finish)
-from work.fields import Cmd, Str
-from work.exceptions import FieldDeclarationError
+from work.fields import Cmd, Int, Str
+from work.exceptions import FieldDeclarationError, ValidationError
 
 
 class CommandTestCase(unittest.TestCase):
@@ -86,6 +86,65 @@ class CommandTestCase(unittest.TestCase):
         self.assertTrue(Test.data == PongD.data)
         self.assertTrue(Test.cmd.id == TEST_COMMAND_ID)
 
+    def test_codec_compatible(self):
+        class Mixed(Packet):
+            cmd = Cmd(100)
+            first = Int()
+            name = Str(maxsize=256)
+            second = Int()
+            value = Str(maxsize=256)
+
+        packet = Mixed(first=1, name='имя', second=2 ** 32 - 1, value='')
+        body = b''.join(field.serialize(getattr(packet, attr))
+                        for attr, field in Mixed._fields.items())
+        data = packet.pack()
+        self.assertEqual(data, Int.serialize(len(body)) + body)
+
+        unpacked = Packet.unpack(memoryview(data)[self.LENGTH:])
+        self.assertIsInstance(unpacked, Mixed)
+        for attr in ('first', 'name', 'second', 'value'):
+            self.assertEqual(getattr(unpacked, attr), getattr(packet, attr))
+
+    def test_truncated(self):
+        data = PingD(data='test_data').pack()[self.LENGTH:-1]
+        with self.assertRaises(ValidationError):
+            Packet.unpack(data)
+        with self.assertRaises(ValidationError):
+            Packet.unpack(data[:3])
+
+    def test_reply_cache(self):
+        replies = ReplyCache()
+        replies.preload(Pong)
+        self.assertIs(replies.frame(Pong), replies.frame(Pong))
+        self.assertEqual(replies.frame(Pong), Pong().pack())
+
+        frame = replies.session(Connected, 'test_session')
+        self.assertIs(replies.session(Connected, 'test_session'), frame)
+        self.assertEqual(frame, Connected(session='test_session').pack())
+        self.assertEqual(replies.stats(), {'hits': 4, 'misses': 1,
+                                           'frames': 1, 'sessions': 1})
+
+        replies.evict('test_session')
+        self.assertEqual(replies.stats()['sessions'], 0)
+        self.assertEqual(replies.session(Connected, 'test_session'), frame)
+        self.assertEqual(replies.misses, 2)
+
+    def test_slots(self):
+        packet = PingD(data='test_data')
+        self.assertFalse(hasattr(packet, '__dict__'))
+        self.assertEqual(packet.cmd, cmd.PINGD)
+        with self.assertRaises(AttributeError):
+            packet.other = 'test_data'
+
+    def test_unpack_validates_size(self):
+        data = Str.serialize('x' * 257)
+        with self.assertRaises(ValidationError):
+            Packet.unpack(bytes([cmd.PINGD]) + data)
+        with self.assertRaises(ValidationError):
+            PingD(data='x' * 257)
+        with self.assertRaises(ValidationError):
+            PingD(data=b'test_data')
+
 
 if __name__ == '__main__':
     import unittest
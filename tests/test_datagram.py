@@ -0,0 +1,65 @@
+import socket
+import unittest
+
+from work.loop import EventLoop
+from work.protocol import unpack_frame
+from work.datagram import DatagramServer
+from work.exceptions import ValidationError
+from work.models import Pong, PongD, Ping, PingD, Connect
+
+
+class DatagramServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.addCleanup(self.eventloop.close)
+        self.server = DatagramServer(self.eventloop)
+        self.server.listen('127.0.0.1', 0)
+        self.addCleanup(self.server.close)
+        self.address = self.server.socket.getsockname()
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(1)
+        self.addCleanup(self.client.close)
+
+    def receive(self):
+        return unpack_frame(memoryview(self.client.recv(65536)))
+
+    def test_ping(self):
+        self.client.sendto(Ping().pack(), self.address)
+        self.client.sendto(PingD(data='probe').pack(), self.address)
+        self.eventloop.run_once(1)
+        self.assertIsInstance(self.receive(), Pong)
+        reply = self.receive()
+        self.assertIsInstance(reply, PongD)
+        self.assertEqual(reply.data, 'probe')
+        self.assertEqual(self.server.stats['replied'], 2)
+        self.assertEqual(self.eventloop.metrics.counters['frames_out'], 2)
+
+    def test_rejected(self):
+        for data in (b'junk', Ping().pack() * 2, Ping().pack()[:-1],
+                     Connect().pack()):
+            self.client.sendto(data, self.address)
+        self.client.sendto(Ping().pack(), self.address)
+        self.eventloop.run_once(1)
+        self.assertIsInstance(self.receive(), Pong)
+        self.assertEqual(self.server.stats['invalid'], 3)
+        self.assertEqual(self.server.stats['ignored'], 1)
+        self.assertEqual(self.server.stats['replied'], 1)
+
+    def test_burst(self):
+        count = DatagramServer.READ_BATCH + 10
+        for i in range(count):
+            self.client.sendto(PingD(data=str(i)).pack(), self.address)
+        self.eventloop.run_once(1)
+        self.assertEqual(self.server.stats['replied'],
+                         DatagramServer.READ_BATCH)
+        # the rest is still readable and comes with the next poll
+        self.eventloop.run_once(1)
+        self.assertEqual(self.server.stats['bursts'], 2)
+        self.assertEqual([self.receive().data for i in range(count)],
+                         [str(i) for i in range(count)])
+
+    def test_unpack_frame(self):
+        self.assertIsInstance(unpack_frame(Ping().pack()), Ping)
+        with self.assertRaises(ValidationError):
+            unpack_frame(b'\x01')
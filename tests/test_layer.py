@@ -0,0 +1,243 @@
+import os
+import socket
+import unittest
+import tempfile
+from types import SimpleNamespace
+from select import EPOLLIN
+
+from work.layer import Transport, Factory, Protocol
+from work.loop import EventLoop
+from work.models import Quit
+from async_server import CommandProtocol
+
+
+class RecordProtocol(Protocol):
+
+    def connection_made(self):
+        self.received = bytearray()
+
+    def data_received(self, data):
+        self.received += data
+
+
+def connect(case, factory):
+    # a registered connection to the factory, its socketpair end as peer
+    conn, peer = socket.socketpair()
+    conn.setblocking(False)
+    case.addCleanup(conn.close)
+    case.addCleanup(peer.close)
+    peer.settimeout(1)
+    protocol = factory.create_protocol(conn)
+    factory.eventloop.handlers[conn.fileno()] = protocol.transport
+    factory.eventloop.poller.register(conn, Transport.READ_MASK)
+    protocol.connection_made()
+    protocol.peer = peer
+    return protocol
+
+
+class TransportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.conn, self.peer = socket.socketpair()
+        self.conn.setblocking(False)
+        self.addCleanup(self.conn.close)
+        self.addCleanup(self.peer.close)
+        self.transport = Transport(self.eventloop)
+        self.protocol = RecordProtocol(self.transport)
+        self.protocol.connection_made()
+        self.protocol.factory = SimpleNamespace(
+            clients={self.conn.fileno(): self.protocol})
+        self.transport.conn = self.conn
+        self.transport.protocol = self.protocol
+        self.eventloop.handlers[self.conn.fileno()] = self.transport
+        self.eventloop.poller.register(self.conn, Transport.READ_MASK)
+
+    def read_all(self, size):
+        data = bytearray()
+        self.peer.settimeout(1)
+        while len(data) < size:
+            data += self.peer.recv(size - len(data))
+        return bytes(data)
+
+    def test_write_flush(self):
+        frames = [bytes([i]) * (i + 1) for i in range(10)]
+        for frame in frames:
+            self.transport.write(frame)
+        self.assertEqual(self.transport.pending, 0)
+        self.assertFalse(self.transport.writing)
+        self.assertFalse(self.transport.out_queue)
+        self.assertEqual(self.read_all(55), b''.join(frames))
+
+    def test_partial_flush(self):
+        frame = bytes(range(256)) * 64
+        count = 64
+        for i in range(count):
+            self.transport.write(frame)
+        expected = frame * count
+        self.peer.settimeout(1)
+        received = bytearray()
+        while len(received) < len(expected):
+            try:
+                self.transport.flush()
+            except BlockingIOError:
+                pass
+            self.assertEqual(self.transport.pending,
+                             sum(map(len, self.transport.out_queue)))
+            received += self.peer.recv(65536)
+        self.assertEqual(bytes(received), expected)
+
+    def test_write_interest(self):
+        frame = bytes(1024 * 1024)
+        self.transport.write(frame)
+        self.assertTrue(self.transport.writing)
+        self.assertTrue(self.transport.pending)
+        received = 0
+        self.peer.settimeout(1)
+        while received < len(frame):
+            received += len(self.peer.recv(65536))
+            self.eventloop.run_once(0)
+        self.assertFalse(self.transport.writing)
+        self.assertEqual(self.transport.pending, 0)
+        self.assertEqual(self.eventloop.poller.poll(0), [])
+
+    def test_read(self):
+        self.peer.sendall(b'data' * 1024)
+        self.eventloop.run_once(0)
+        self.assertEqual(bytes(self.protocol.received), b'data' * 1024)
+        self.assertEqual(len(self.transport.in_buffer), 2 * 4096)
+
+    def test_read_budget(self):
+        self.transport.read_budget = 4096
+        self.peer.sendall(bytes(3 * 4096))
+        self.transport(EPOLLIN)
+        self.assertEqual(len(self.protocol.received), 4096)
+        self.assertEqual(len(self.eventloop._soon), 1)
+        self.eventloop.process_delayed_calls()
+        self.assertEqual(len(self.protocol.received), 3 * 4096)
+
+    def test_eof(self):
+        fd = self.conn.fileno()
+        self.peer.close()
+        self.eventloop.run_once(0)
+        self.assertIsNone(self.protocol.transport)
+        self.assertFalse(self.protocol.factory.clients)
+        self.assertNotIn(fd, self.eventloop.handlers)
+
+    def test_shared_frame(self):
+        frame = b'shared'
+        self.transport.writing = True
+        self.transport.write(frame)
+        self.transport.write(frame)
+        self.assertIs(self.transport.out_queue[0].obj, frame)
+        self.assertIs(self.transport.out_queue[1].obj, frame)
+
+
+class FactoryTestCase(unittest.TestCase):
+
+    HIGH_WATER = 64 * 1024
+    FRAME = bytes(1024)
+
+    def create_factory(self, policy, protocol=RecordProtocol):
+        eventloop = EventLoop()
+        factory = Factory(eventloop, protocol, policy=policy,
+                          high_water=self.HIGH_WATER, coalesce_limit=2)
+        self.addCleanup(factory.socket.close)
+        fast, slow = connect(self, factory), connect(self, factory)
+        slow.transport.write(bytes(4 * 1024 * 1024))
+        self.assertGreaterEqual(slow.transport.pending, self.HIGH_WATER)
+        return factory, fast, slow
+
+    def test_clients(self):
+        factory, fast, slow = self.create_factory(Factory.DROP)
+        self.assertEqual(factory.clients,
+                         {fast.transport.conn.fileno(): fast,
+                          slow.transport.conn.fileno(): slow})
+        fast.connection_lost()
+        self.assertEqual(list(factory.clients.values()), [slow])
+
+    def test_drop(self):
+        factory, fast, slow = self.create_factory(Factory.DROP)
+        pending = slow.transport.pending
+        factory.broadcast(self.FRAME)
+        self.assertEqual(fast.peer.recv(2048), self.FRAME)
+        self.assertEqual(slow.transport.pending, pending)
+        self.assertEqual(factory.stats['frames'], 1)
+        self.assertEqual(factory.stats['dropped'], 1)
+        self.assertEqual(factory.stats['broadcasts'], 1)
+
+    def test_disconnect(self):
+        factory, fast, slow = self.create_factory(Factory.DISCONNECT)
+        factory.broadcast(self.FRAME)
+        self.assertIsNone(slow.transport)
+        self.assertEqual(list(factory.clients.values()), [fast])
+        self.assertEqual(factory.stats['disconnected'], 1)
+
+    def test_disconnect_sender(self):
+        factory, fast, slow = self.create_factory(Factory.DISCONNECT,
+                                                  CommandProtocol)
+        reply = Quit().reply(slow.session)
+        slow.peer.sendall(Quit().pack())
+        factory.eventloop.run_once(1)
+        self.assertIsNone(slow.transport)
+        self.assertEqual(list(factory.clients.values()), [fast])
+        self.assertEqual(fast.peer.recv(len(reply)), reply)
+
+    def test_coalesce(self):
+        factory, fast, slow = self.create_factory(Factory.COALESCE)
+        frames = [bytes([i]) * 16 for i in range(3)]
+        for frame in frames + frames[1:2]:
+            factory.broadcast(frame)
+        self.assertEqual(list(slow.transport.parked), [frames[1], frames[2]])
+        self.assertEqual(factory.stats['coalesced'], 3)
+        self.assertEqual(factory.stats['dropped'], 1)
+
+        received = 0
+        while received < 4 * 1024 * 1024 + 32:
+            received += len(slow.peer.recv(1024 * 1024))
+            factory.eventloop.run_once(0)
+        self.assertIsNone(slow.transport.parked)
+        self.assertEqual(slow.transport.pending, 0)
+
+    def test_coalesce_order(self):
+        factory, fast, slow = self.create_factory(Factory.COALESCE)
+        factory.broadcast(b'A')
+        # the queue drains below the mark before the parked frame is sent
+        factory.high_water = slow.transport.pending + 1
+        factory.broadcast(b'B')
+        factory.broadcast(b'A')
+        self.assertEqual(list(slow.transport.parked), [b'A', b'B'])
+
+        received = bytearray()
+        while len(received) < 4 * 1024 * 1024 + 2:
+            received += slow.peer.recv(1024 * 1024)
+            factory.eventloop.run_once(0)
+        self.assertEqual(received[-2:], b'AB')
+
+    def test_listen_unix(self):
+        eventloop = EventLoop()
+        self.addCleanup(eventloop.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'server.sock')
+        # a stale socket file from an earlier run is replaced
+        with socket.socket(socket.AF_UNIX) as stale:
+            stale.bind(path)
+        factory = Factory(eventloop, RecordProtocol)
+        factory.listen_unix(path)
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(path)
+            eventloop.run_once(1)
+            protocol, = factory.clients.values()
+            sock.sendall(b'data')
+            eventloop.run_once(1)
+            self.assertEqual(protocol.received, b'data')
+            protocol.transport.write(b'reply')
+            self.assertEqual(sock.recv(16), b'reply')
+        factory.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,244 @@
+import time
+import random
+import unittest
+import threading
+from types import SimpleNamespace
+
+from work.loop import TimeLoop, EventLoop
+from work.timers import HeapTimers, TimingWheel, TimerThread
+from work.delayedcall import DelayedCall
+
+
+def record(eventloop, value):
+    eventloop.fired.append(value)
+
+
+def record_future(eventloop, future):
+    eventloop.fired.append((threading.current_thread(), future.result()))
+
+
+def square(value):
+    return value * value
+
+
+class TimersTestMixin:
+
+    START = 1000.0
+
+    def create_loop(self):
+        loop = TimeLoop(self.create_timers(start=None))
+        loop.fired = []
+        return loop
+
+    def schedule(self, timers, when, value=None):
+        dc = DelayedCall(None, when, record, (value, ))
+        timers.push(dc)
+        return dc
+
+    def test_order(self):
+        timers = self.create_timers()
+        for i in range(3):
+            self.schedule(timers, self.START + 3 - i, i)
+        due = []
+        timers.pop_due(self.START + 2.5, due)
+        self.assertEqual(sorted(dc.args[0] for dc in due), [1, 2])
+        due = []
+        timers.pop_due(self.START + 3, due)
+        self.assertEqual([dc.args[0] for dc in due], [0])
+        self.assertEqual(len(timers), 0)
+
+    def test_cancel(self):
+        timers = self.create_timers()
+        calls = [self.schedule(timers, self.START + 0.5) for i in range(200)]
+        for dc in calls[:150]:
+            dc.cancel()
+        self.assertEqual(len(timers), 50)
+        due = []
+        timers.pop_due(self.START + 1, due)
+        self.assertEqual(due, calls[150:])
+        self.assertEqual(len(timers), 0)
+        self.assertTrue(all(dc.timers is None for dc in calls[150:]))
+
+    def test_process_delayed_calls(self):
+        loop = self.create_loop()
+        loop.call_later(-1, record, 'later')
+        loop.call_soon(record, 'soon')
+        loop.call_later(3600, record, 'never')
+        loop.process_delayed_calls()
+        self.assertEqual(loop.fired, ['soon', 'later'])
+        self.assertGreater(loop.timeout, 0)
+        self.assertLessEqual(loop.timeout, loop.DEFAULT_TIMEOUT)
+
+
+class HeapTimersTestCase(TimersTestMixin, unittest.TestCase):
+
+    def create_timers(self, start=None):
+        return HeapTimers()
+
+
+class TimingWheelTestCase(TimersTestMixin, unittest.TestCase):
+
+    RESOLUTION = 0.01
+
+    def create_timers(self, start=TimersTestMixin.START):
+        return TimingWheel(self.RESOLUTION, slots=16, levels=2, start=start)
+
+    def test_levels(self):
+        rnd = random.Random(0)
+        timers = self.create_timers()
+        calls = [self.schedule(timers, self.START + rnd.uniform(0, 200))
+                 for i in range(2000)]
+
+        now, fired = self.START, []
+        while len(timers):
+            step = rnd.uniform(0, 0.5)
+            now += step
+            due = []
+            timers.pop_due(now, due)
+            for dc in due:
+                self.assertLessEqual(dc.when, now)
+                self.assertGreater(dc.when, now - step - self.RESOLUTION)
+            fired += due
+            self.assertGreaterEqual(timers.next_timeout(now, 1), 0)
+        self.assertEqual(sorted(map(id, fired)), sorted(map(id, calls)))
+
+
+class TimerThreadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = TimerThread()
+        self.timer.fired = []
+        self.timer.start()
+        self.addCleanup(self.timer.stop)
+
+    def test_call_later(self):
+        done = threading.Event()
+        self.timer.call_later(0.02, record, 2)
+        self.timer.call_later(0.01, record, 1)
+        self.timer.call_later(0.03, lambda timer: done.set())
+        self.assertTrue(done.wait(1))
+        self.assertEqual(self.timer.fired, [1, 2])
+
+    def test_cancel(self):
+        done = threading.Event()
+        self.timer.call_later(0.01, record, 1).cancel()
+        self.timer.call_later(0.02, lambda timer: done.set())
+        self.assertTrue(done.wait(1))
+        self.assertEqual(self.timer.fired, [])
+        self.assertEqual(len(self.timer.timers), 0)
+
+
+class DelayedCallTestCase(unittest.TestCase):
+
+    def test_validation_cached(self):
+        DelayedCall._validated.clear()
+        self.assertIsNotNone(DelayedCall(None, 0, record, (1, )))
+        self.assertIsNone(DelayedCall(None, 0, record, (1, 2)))
+        self.assertEqual(DelayedCall._validated,
+                         {(record, False, 1): True, (record, False, 2): False})
+        self.assertIsNone(DelayedCall(None, 0, record, (1, 2)))
+        self.assertEqual(len(DelayedCall._validated), 2)
+
+    def test_bound_method(self):
+        loop = TimeLoop()
+        first, second = TimeLoop(), TimeLoop()
+        self.assertIsNotNone(loop.call_soon(first.call_later, 1))
+        self.assertIsNone(loop.call_soon(second.call_later))
+        self.assertIsNone(loop.call_soon(first.call_later))
+
+    def test_check_args_disabled(self):
+        loop = TimeLoop(check_args=False)
+        self.assertIsNotNone(loop.call_soon(record, 1, 2))
+
+    def test_slots(self):
+        dc = DelayedCall(None, 0, record, (1, ))
+        self.assertFalse(hasattr(dc, '__dict__'))
+        self.assertLess(dc, DelayedCall(None, 1, record, (1, )))
+
+
+class EventLoopTestCase(unittest.TestCase):
+
+    def test_timers_without_events(self):
+        loop = EventLoop()
+        loop.fired = []
+        loop.call_later(-1, record, 'later')
+        loop.call_soon(record, 'soon')
+        loop.run_once(0)
+        self.assertEqual(loop.fired, ['soon', 'later'])
+        self.assertEqual(loop.timeout, loop.DEFAULT_TIMEOUT)
+        self.assertEqual(loop.iterations, 1)
+        self.assertEqual(set(loop.phase_times),
+                         {'poll', 'io', 'timers', 'timeout'})
+
+    def test_timers_once_per_iteration(self):
+        loop = EventLoop()
+        calls = []
+        loop.run_delayed_calls = lambda: calls.append(None)
+        for fd in range(3):
+            loop.handlers[fd] = lambda event: None
+        loop.poller = SimpleNamespace(
+            poll=lambda timeout, max_events: [(0, 1), (1, 1), (2, 1)])
+        loop.run_once(0)
+        self.assertEqual(len(calls), 1)
+
+    def test_call_soon_threadsafe(self):
+        loop = EventLoop()
+        loop.fired = []
+        thread = threading.Timer(0.05, loop.call_soon_threadsafe,
+                                 (record, 'thread'))
+        thread.start()
+        self.addCleanup(thread.join)
+        started = time.monotonic()
+        while not loop.fired:
+            loop.run_once(5)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(loop.fired, ['thread'])
+        self.assertFalse(loop._wakeup_pending)
+
+    def test_wakeup_coalesced(self):
+        loop = EventLoop()
+        loop.fired = []
+        for i in range(3):
+            loop.call_soon_threadsafe(record, i)
+        self.assertEqual(len(loop.poller.poll(0)), 1)
+        loop.run_once(0)
+        self.assertEqual(loop.fired, [0, 1, 2])
+        self.assertEqual(loop.poller.poll(0), [])
+
+
+class ExecutorTestCase(unittest.TestCase):
+
+    def run_until_fired(self, loop, count=1):
+        started = time.monotonic()
+        while len(loop.fired) < count:
+            self.assertLess(time.monotonic() - started, 10)
+            loop.run_once(loop.timeout)
+
+    def test_result_on_loop_thread(self):
+        loop = EventLoop()
+        loop.fired = []
+        self.addCleanup(loop.stop)
+        future = loop.run_in_executor(None, lambda loop, value: value * 2, 21,
+                                      callback=record_future)
+        self.run_until_fired(loop)
+        self.assertEqual(loop.fired, [(threading.current_thread(), 42)])
+        self.assertEqual(future.result(), 42)
+        stats = loop.executor_stats
+        self.assertEqual((stats['submitted'], stats['completed'],
+                          stats['pending']), (1, 1, 0))
+        self.assertIs(loop.run_in_executor(None, square, 1).__class__,
+                      future.__class__)
+        self.assertEqual(len(loop._executors), 1)
+
+    def test_process_pool(self):
+        loop = EventLoop(process_workers=1)
+        loop.fired = []
+        self.addCleanup(loop.stop)
+        loop.run_in_process(square, 7, callback=record_future)
+        self.run_until_fired(loop)
+        self.assertEqual(loop.fired[0][1], 49)
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import unittest
+
+from work.loop import EventLoop
+from work.layer import Factory
+from work.protocol import Packet
+from work.models import StatsReply, Stats, Ping
+from work.metrics import Histogram, snapshot
+from async_server import CommandProtocol
+from .test_layer import connect
+
+
+def record(eventloop, value):
+    pass
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(Histogram().snapshot(), {'count': 0})
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.add(value)
+        self.assertEqual(histogram.snapshot(),
+                         {'count': 1000, 'p50': 512, 'p99': 1024,
+                          'p999': 1024, 'max': 1024})
+
+    def test_scale(self):
+        histogram = Histogram(scale=1e6)
+        histogram.add(0.000003)
+        self.assertEqual(histogram.snapshot()['p50'], 4)
+
+
+class LoopMetricsTestCase(unittest.TestCase):
+
+    def test_loop(self):
+        loop = EventLoop()
+        self.addCleanup(loop.close)
+        loop.call_later(-0.01, record, 1)
+        loop.call_soon(record, 2)
+        loop.run_once(0)
+        histograms = loop.metrics.histograms
+        self.assertEqual(histograms['poll_wait'].count, 1)
+        self.assertEqual(histograms['events'].count, 1)
+        self.assertEqual(histograms['callback_time'].count, 1)
+        self.assertEqual(histograms['timer_lag'].count, 1)
+        self.assertGreaterEqual(histograms['timer_lag'].percentile(1), 10000)
+
+    def test_snapshot(self):
+        loop = EventLoop()
+        self.addCleanup(loop.close)
+        loop.run_once(0)
+        data = json.loads(json.dumps(snapshot(loop)))
+        self.assertEqual(data['loop']['iterations'], 1)
+        self.assertEqual(data['loop']['poll_wait']['count'], 1)
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.addCleanup(self.eventloop.close)
+        self.factory = Factory(self.eventloop, CommandProtocol)
+        self.addCleanup(self.factory.socket.close)
+        self.protocol = connect(self, self.factory)
+        self.peer = self.protocol.peer
+
+    def test_stats(self):
+        ping, stats = Ping().pack(), Stats().pack()
+        self.peer.sendall(ping + stats)
+        self.eventloop.run_once(1)
+        data = self.peer.recv(65536)[len(ping):]
+        reply = Packet.unpack(memoryview(data)[4:])
+        self.assertIsInstance(reply, StatsReply)
+        result = json.loads(reply.data)
+        self.assertEqual(result['connection']['bytes_in'],
+                         len(ping) + len(stats))
+        self.assertEqual(result['connection']['frames_in'], 2)
+        self.assertEqual(result['connection']['frames_out'], 1)
+        self.assertEqual(result['factory']['clients'], 1)
+        self.assertEqual(result['loop']['frames_in'], 2)
+        # the PONG came out of the reply cache
+        self.assertGreaterEqual(result['replies']['hits'], 1)
+        self.assertEqual(self.protocol.transport.frames_out, 2)
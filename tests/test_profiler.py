@@ -0,0 +1,93 @@
+import os
+import time
+import signal
+import tempfile
+import unittest
+
+from work.loop import EventLoop
+from work.layer import Factory
+from work.models import Ping
+from work.profiler import Profiler, handler_name
+from async_server import CommandProtocol
+from .test_layer import connect
+
+
+def sleepy(eventloop, seconds):
+    time.sleep(seconds)
+
+
+def busy(eventloop, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.addCleanup(self.eventloop.close)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def install(self, interval=None, signum=None, threshold=0.05):
+        profiler = Profiler(self.eventloop, threshold, interval,
+                            self.directory.name)
+        profiler.install(signum)
+        self.addCleanup(profiler.uninstall)
+        return profiler
+
+    def connect(self):
+        factory = Factory(self.eventloop, CommandProtocol)
+        self.addCleanup(factory.socket.close)
+        protocol = connect(self, factory)
+        return protocol, protocol.peer
+
+    def test_slow_callback(self):
+        profiler = self.install()
+        self.eventloop.call_soon(sleepy, 0)
+        self.eventloop.call_soon(sleepy, 0.06)
+        with self.assertLogs(level='WARNING') as logs:
+            self.eventloop.run_once(0)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('slow timers callback sleepy', logs.output[0])
+        calls, total, longest = profiler.timings[('timers', 'sleepy')]
+        self.assertEqual(calls, 2)
+        self.assertGreaterEqual(longest, 0.06)
+
+    def test_handlers(self):
+        profiler = self.install()
+        protocol, peer = self.connect()
+        peer.sendall(Ping().pack())
+        self.eventloop.run_once(1)
+        self.assertEqual(peer.recv(4096), Ping().reply())
+        name = handler_name(protocol.transport)
+        self.assertEqual(name, 'Transport[CommandProtocol]')
+        self.assertEqual(profiler.timings[('io', name)][0], 1)
+        lines = list(profiler.collapsed_timings())
+        self.assertRegex(lines[0],
+                         r'^run_once;io;Transport\[CommandProtocol\] \d+$')
+
+    def test_sampler(self):
+        profiler = self.install(interval=0.001)
+        self.eventloop.call_soon(busy, 0.2)
+        self.eventloop.run_once(0)
+        profiler.uninstall()
+        stacks = list(profiler.collapsed_samples())
+        self.assertTrue(any(';busy (test_profiler.py:' in line
+                            for line in stacks))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit()
+                            for line in stacks))
+
+    def test_signal(self):
+        profiler = self.install(signum=signal.SIGUSR1)
+        self.eventloop.call_soon(sleepy, 0)
+        self.eventloop.run_once(0)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.eventloop.run_once(1)
+        path = os.path.join(self.directory.name,
+                            'handlers-{}.folded'.format(os.getpid()))
+        with open(path) as f:
+            self.assertRegex(f.read(), r'(?m)^run_once;timers;sleepy \d+$')
+        profiler.uninstall()
+        self.assertEqual(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
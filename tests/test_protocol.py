@@ -0,0 +1,61 @@
+import unittest
+
+from work.protocol import feed
+from work.models import Ping, PingD, Connected
+
+
+class FeedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.feeder = feed()
+        next(self.feeder)
+
+    def test_single(self):
+        packets = self.feeder.send(Ping().pack())
+        self.assertEqual(len(packets), 1)
+        self.assertIsInstance(packets[0], Ping)
+
+    def test_pipelined(self):
+        data = (Ping().pack() + PingD(data='test_data').pack() +
+                Connected(session='test_session').pack())
+        packets = self.feeder.send(data)
+        self.assertEqual([p.__class__ for p in packets],
+                         [Ping, PingD, Connected])
+        self.assertEqual(packets[1].data, 'test_data')
+        self.assertEqual(packets[2].session, 'test_session')
+
+    def test_split(self):
+        data = PingD(data='test_data').pack() * 2
+        packets = []
+        for i in range(len(data)):
+            packets += self.feeder.send(data[i:i + 1])
+        self.assertEqual(len(packets), 2)
+        self.assertTrue(all(p.data == 'test_data' for p in packets))
+
+    def test_partial_tail(self):
+        data = Ping().pack() + PingD(data='test_data').pack()
+        packets = self.feeder.send(data[:-3])
+        self.assertEqual(len(packets), 1)
+        packets = self.feeder.send(data[-3:])
+        self.assertEqual(len(packets), 1)
+        self.assertIsInstance(packets[0], PingD)
+
+    def test_invalid_skipped(self):
+        invalid = (1).to_bytes(4, 'little') + bytes([255])
+        packets = self.feeder.send(invalid + Ping().pack())
+        self.assertEqual(len(packets), 1)
+        self.assertIsInstance(packets[0], Ping)
+
+    def test_many_frames(self):
+        frame = PingD(data='x' * 200).pack()
+        count = 64 * 1024 // len(frame) + 10
+        packets = self.feeder.send(frame * count + frame[:5])
+        self.assertEqual(len(packets), count)
+        packets = self.feeder.send(frame[5:])
+        self.assertEqual(len(packets), 1)
+        self.assertEqual(packets[0].data, 'x' * 200)
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -1,4 +1,5 @@
 import os
+import json
 import os.path
 import time
 import socket
@@ -8,8 +9,9 @@ import subprocess
 
 from work.utils import get_msg
 from work.protocol import Packet
-from work.models import (Connected, Pong, PongD, AckQuit, AckFinish,
-                         Connect, Ping, PingD, Quit, Finish)
+from work.models import (Connected, Pong, PongD, Delayed, AckQuit, AckFinish,
+                         StatsReply, Connect, Ping, PingD, Delay, Quit,
+                         Finish, Stats)
 
 
 class ServerTestCase(unittest.TestCase):
@@ -17,9 +19,12 @@ class ServerTestCase(unittest.TestCase):
     HOST = ''
     PORT = 50007
     TERMINATE_TIMEOUT = 1
+    DELAY_TIMEOUT = 5
+    ARGS = []
 
     def setUp(self):
-        self.server = subprocess.Popen(['python3.3', 'sync_server.py'])
+        self.server = subprocess.Popen(['python3.3', 'sync_server.py'] +
+                                       self.ARGS)
         self.addCleanup(self.stop_server)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         while True:
@@ -55,6 +60,66 @@ class ServerTestCase(unittest.TestCase):
         self.assertIsInstance(reply, PongD)
         self.assertEqual(packet.data, reply.data)
 
+    def test_delay(self):
+        packet = Delay(data='test_data')
+        self.socket.sendall(packet.pack() + Ping().pack())
+        self.assertIsInstance(Packet.unpack(get_msg(self.socket)), Pong)
+        reply = Packet.unpack(get_msg(self.socket))
+        self.assertIsInstance(reply, Delayed)
+        self.assertEqual(packet.data, reply.data)
+
+    def test_delay_not_read(self):
+        # the delayed replies fill the buffer of a client that never reads
+        frame = Delay(data='x' * 256).pack()
+        try:
+            self.socket.sendall(frame * 100000)
+        except ConnectionResetError:
+            # dropped before it was done writing
+            pass
+        with socket.create_connection(('localhost', self.PORT)) as sock:
+            sock.settimeout(self.DELAY_TIMEOUT)
+            sock.sendall(Delay(data='data').pack())
+            self.assertEqual(Packet.unpack(get_msg(sock)).data, 'data')
+
+    def test_many_clients(self):
+        sockets = []
+        for i in range(16):
+            sock = socket.create_connection(('localhost', self.PORT))
+            sock.settimeout(self.TERMINATE_TIMEOUT)
+            self.addCleanup(sock.close)
+            sockets.append(sock)
+        for i in range(3):
+            for sock in sockets:
+                sock.sendall(Ping().pack())
+            for sock in sockets:
+                self.assertIsInstance(Packet.unpack(get_msg(sock)), Pong)
+
+    def test_unexpected(self):
+        self.socket.settimeout(self.TERMINATE_TIMEOUT)
+        self.socket.sendall(Pong().pack())
+        self.assertEqual(self.socket.recv(16), b'')
+        with socket.create_connection(('localhost', self.PORT)) as sock:
+            sock.settimeout(self.TERMINATE_TIMEOUT)
+            sock.sendall(Ping().pack())
+            self.assertIsInstance(Packet.unpack(get_msg(sock)), Pong)
+            deadline = time.monotonic() + self.TERMINATE_TIMEOUT
+            while True:
+                sock.sendall(Stats().pack())
+                reply = Packet.unpack(get_msg(sock))
+                if json.loads(reply.data)['clients'] == 1:
+                    break
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+    def test_stats(self):
+        self.socket.sendall(Stats().pack())
+        reply = Packet.unpack(get_msg(self.socket))
+        self.assertIsInstance(reply, StatsReply)
+        result = json.loads(reply.data)
+        self.assertEqual(result['clients'], 1)
+        self.assertEqual(set(result['replies']),
+                         {'hits', 'misses', 'frames', 'sessions'})
+
     def test_quit(self):
         packet = Quit().pack()
         self.socket.sendall(packet)
@@ -71,6 +136,67 @@ class ServerTestCase(unittest.TestCase):
         self.assertTrue(self.server.poll() is not None)
 
 
+class PooledServerTestCase(ServerTestCase):
+
+    ARGS = ['-pool', '2', '-backlog', '32']
+
+
+class AsyncServerTestCase(unittest.TestCase):
+
+    PORT = 50037
+    TERMINATE_TIMEOUT = 5
+    ARGS = []
+
+    def setUp(self):
+        self.server = subprocess.Popen(
+            ['python3.3', 'async_server.py', '-port', str(self.PORT)] +
+            self.ARGS)
+        self.addCleanup(self.stop_server)
+        self.socket = self.connect()
+        self.addCleanup(self.socket.close)
+
+    def connect(self):
+        while True:
+            try:
+                sock = socket.create_connection(('localhost', self.PORT))
+            except ConnectionRefusedError:
+                time.sleep(0.01)
+            else:
+                sock.settimeout(self.TERMINATE_TIMEOUT)
+                return sock
+
+    def stop_server(self):
+        if self.server.poll() is None:
+            os.kill(self.server.pid, signal.SIGINT)
+            self.server.wait(self.TERMINATE_TIMEOUT)
+
+    def test_unexpected(self):
+        self.socket.sendall(Pong().pack())
+        self.assertEqual(self.socket.recv(16), b'')
+        with self.connect() as sock:
+            sock.sendall(Ping().pack())
+            self.assertIsInstance(Packet.unpack(get_msg(sock)), Pong)
+            sock.sendall(Stats().pack())
+            reply = Packet.unpack(get_msg(sock))
+            self.assertEqual(json.loads(reply.data)['factory']['clients'], 1)
+
+    def test_finish(self):
+        self.socket.sendall(Finish().pack())
+        self.assertIsInstance(Packet.unpack(get_msg(self.socket)), AckFinish)
+        self.server.wait(timeout=self.TERMINATE_TIMEOUT)
+        self.assertEqual(self.server.returncode, 0)
+
+
+class WheelAsyncServerTestCase(AsyncServerTestCase):
+
+    ARGS = ['-timers', 'wheel']
+
+
+class AsyncioServerTestCase(AsyncServerTestCase):
+
+    ARGS = ['-backend', 'asyncio']
+
+
 if __name__ == '__main__':
     import unittest
     unittest.main()
\ No newline at end of file
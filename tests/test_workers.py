@@ -0,0 +1,123 @@
+import os
+import time
+import socket
+import signal
+import unittest
+import subprocess
+from types import SimpleNamespace
+
+from work.loop import EventLoop
+from work.utils import get_msg
+from work.protocol import Packet
+from work.models import Connected, AckFinish, Connect, Finish
+from work.workers import ChannelProtocol, Supervisor, open_channel
+
+
+def crash(sock):
+    raise RuntimeError('crash')
+
+
+class ChannelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eventloop = EventLoop()
+        self.addCleanup(self.eventloop.close)
+        self.owner = SimpleNamespace(clients={})
+        self.received = []
+        self.lost = []
+        left, right = socket.socketpair()
+        self.left = open_channel(self.eventloop, left, self.owner,
+                                 self.record, self.lost.append)
+        self.right = open_channel(self.eventloop, right, self.owner,
+                                  self.record, self.lost.append)
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+
+    def record(self, channel, kind, data):
+        self.received.append((channel, kind, data))
+
+    def test_messages(self):
+        self.left.send(ChannelProtocol.BROADCAST, b'frame')
+        self.left.send(ChannelProtocol.FINISH)
+        self.eventloop.run_once(1)
+        self.assertEqual(self.received,
+                         [(self.right, ChannelProtocol.BROADCAST, b'frame'),
+                          (self.right, ChannelProtocol.FINISH, b'')])
+
+    def test_split_message(self):
+        data = ChannelProtocol.HEADER.pack(ChannelProtocol.BROADCAST, 4)
+        data += b'abcd'
+        for i in range(len(data)):
+            self.right.data_received(memoryview(data)[i:i + 1])
+        self.assertEqual(self.received,
+                         [(self.right, ChannelProtocol.BROADCAST, b'abcd')])
+
+    def test_lost(self):
+        self.left.connection_lost()
+        self.eventloop.run_once(1)
+        self.assertEqual(self.lost, [self.left, self.right])
+        self.left.send(ChannelProtocol.FINISH)
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        for signum in (signal.SIGCHLD, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+    def test_restart(self):
+        supervisor = Supervisor(2, crash)
+        supervisor.RESTART_DELAY = 0
+        self.addCleanup(supervisor.eventloop.close)
+        self.addCleanup(supervisor.terminate)
+        supervisor.start()
+        deadline = time.monotonic() + 5
+        while supervisor.restarts < 4 and time.monotonic() < deadline:
+            supervisor.eventloop.run_once(0.1)
+        self.assertGreaterEqual(supervisor.restarts, 4)
+
+
+class WorkersServerTestCase(unittest.TestCase):
+
+    HOST = ''
+    PORT = 50017
+    WORKERS = 2
+    CLIENTS = 16
+    TERMINATE_TIMEOUT = 5
+
+    def setUp(self):
+        self.server = subprocess.Popen(
+            ['python3.3', 'async_server.py', '-port', str(self.PORT),
+             '-workers', str(self.WORKERS)])
+        self.addCleanup(self.stop_server)
+        self.sockets = []
+        for i in range(self.CLIENTS):
+            sock = self.connect()
+            sock.settimeout(self.TERMINATE_TIMEOUT)
+            self.addCleanup(sock.close)
+            self.sockets.append(sock)
+
+    def connect(self):
+        while True:
+            try:
+                return socket.create_connection(('localhost', self.PORT))
+            except ConnectionRefusedError:
+                time.sleep(0.01)
+
+    def stop_server(self):
+        if self.server.poll() is None:
+            os.kill(self.server.pid, signal.SIGINT)
+            self.server.wait(self.TERMINATE_TIMEOUT)
+
+    def test_broadcast(self):
+        # the kernel spreads the clients, so some sit on the other worker
+        self.sockets[0].sendall(Connect().pack())
+        for sock in self.sockets:
+            self.assertIsInstance(Packet.unpack(get_msg(sock)), Connected)
+
+    def test_finish(self):
+        self.sockets[0].sendall(Finish().pack())
+        for sock in self.sockets:
+            self.assertIsInstance(Packet.unpack(get_msg(sock)), AckFinish)
+        self.server.wait(timeout=self.TERMINATE_TIMEOUT)
+        self.assertEqual(self.server.returncode, 0)
@@ -0,0 +1,128 @@
+import asyncio
+
+from .layer import Transport, Factory
+from .utils import unlink_socket
+
+
+class AsyncioLoop:
+
+    def __init__(self, loop=None):
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+
+    def call_soon(self, cb, *args):
+        return self.loop.call_soon(cb, self, *args)
+
+    def call_soon_threadsafe(self, cb, *args):
+        return self.loop.call_soon_threadsafe(cb, self, *args)
+
+    def call_later(self, delay, cb, *args):
+        return self.loop.call_later(delay, cb, self, *args)
+
+    def run(self):
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.stop()
+
+    def close(self):
+        self.loop.close()
+
+
+class AsyncioTransport:
+
+    park = Transport.park
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.parked = None
+        self.frames_in = self.frames_out = 0
+
+    @property
+    def pending(self):
+        return self.transport.get_write_buffer_size()
+
+    @property
+    def closing(self):
+        return self.transport.is_closing()
+
+    def write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+            self.frames_out += 1
+
+    def count_frames(self, count):
+        self.frames_in += count
+
+    def unpark(self):
+        parked, self.parked = self.parked, None
+        for data in parked or ():
+            self.write(data)
+
+    def close(self):
+        self.transport.close()
+
+    def abort(self):
+        self.protocol.factory.clients.pop(self.fd, None)
+        self.transport.abort()
+
+
+class AsyncioAdapter(asyncio.Protocol):
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.protocol = None
+
+    def connection_made(self, transport):
+        self.protocol = self.factory.create_protocol(transport)
+        self.protocol.connection_made()
+
+    def data_received(self, data):
+        protocol = self.protocol
+        if protocol.transport is not None:
+            protocol.data_received(data)
+
+    def connection_lost(self, exc):
+        if self.protocol.transport is not None:
+            self.protocol.connection_lost(exc)
+
+    def resume_writing(self):
+        transport = self.protocol.transport
+        if transport is not None and transport.parked:
+            transport.unpark()
+
+
+class AsyncioFactory(Factory):
+
+    def create_server(self):
+        # the listening socket belongs to asyncio
+        return None
+
+    def listen(self, host, port):
+        loop = self.eventloop.loop
+        self.server = loop.run_until_complete(loop.create_server(
+            lambda: AsyncioAdapter(self), host or None, port,
+            backlog=self.MAX_CONN, reuse_address=True))
+
+    def listen_unix(self, path):
+        unlink_socket(path)
+        self.path = path
+        loop = self.eventloop.loop
+        self.server = loop.run_until_complete(loop.create_unix_server(
+            lambda: AsyncioAdapter(self), path, backlog=self.MAX_CONN))
+
+    def create_protocol(self, transport):
+        transport.set_write_buffer_limits(high=self.high_water)
+        wrapper = AsyncioTransport(transport)
+        protocol = self.protocol(wrapper)
+        wrapper.protocol, protocol.factory = protocol, self
+        wrapper.fd = transport.get_extra_info('socket').fileno()
+        self.clients[wrapper.fd] = protocol
+        return protocol
+
+    def close(self):
+        self.server.close()
+        if self.path is not None:
+            unlink_socket(self.path)
+        for protocol in list(self.clients.values()):
+            if protocol.transport:
+                protocol.transport.close()
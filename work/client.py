@@ -0,0 +1,254 @@
+import os
+import errno
+import socket
+from functools import partial
+from collections import deque
+from concurrent.futures import Future
+from select import EPOLLOUT, EPOLLHUP, EPOLLERR
+
+from .protocol import feed
+from .models import cmd, Connect
+from .layer import Transport, Factory, Protocol
+
+
+def resolve(future, result=None, exception=None):
+    # False when the caller cancelled it first
+    if not future.set_running_or_notify_cancel():
+        return False
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return True
+
+
+def chain(target, future):
+    if future.cancelled():
+        target.cancel()
+        return
+    exception = future.exception()
+    resolve(target, None if exception else future.result(), exception)
+
+
+class ReplyMatcher:
+
+    # what match() returns for a packet nobody on this connection awaits
+    BROADCAST = object()
+    UNEXPECTED = object()
+
+    def __init__(self, claimed=()):
+        self.session = None
+        # sessions of other connections of ours, never taken for a reply
+        self.claimed = claimed
+        self.waiting = {}
+        self.inflight = 0
+
+    def expect(self, reply, waiter):
+        # replies of one type come back in order
+        self.waiting.setdefault(reply, deque()).append(waiter)
+        self.inflight += 1
+
+    def match(self, packet):
+        waiting = self.waiting.get(packet.cmd)
+        session = getattr(packet, 'session', None)
+        if session is not None:
+            # the first unclaimed one we wait for is ours, the rest are
+            # broadcasts for the other sessions
+            if (self.session is None and waiting and
+                    session not in self.claimed):
+                self.session = session
+            if session != self.session:
+                return self.BROADCAST
+        if not waiting:
+            return self.UNEXPECTED
+        self.inflight -= 1
+        return waiting.popleft()
+
+    def clear(self):
+        waiting, self.waiting = self.waiting, {}
+        self.inflight = 0
+        return [waiter for waiters in waiting.values() for waiter in waiters]
+
+
+class ClientProtocol(Protocol):
+
+    def connection_made(self):
+        self.feeder = feed()
+        next(self.feeder)
+        self.replies = ReplyMatcher(self.factory.claimed)
+        self.broadcasts = 0
+
+    @property
+    def session(self):
+        return self.replies.session
+
+    @property
+    def inflight(self):
+        return self.replies.inflight
+
+    def data_received(self, data):
+        packets = self.feeder.send(data)
+        self.transport.count_frames(len(packets))
+        match = self.replies.match
+        for packet in packets:
+            future = match(packet)
+            if (future is ReplyMatcher.BROADCAST or
+                    future is ReplyMatcher.UNEXPECTED):
+                self.broadcast_received(packet)
+                continue
+            resolve(future, packet)
+
+    def broadcast_received(self, packet):
+        self.broadcasts += 1
+
+    def send(self, data, reply):
+        # loop thread only, replies of one type come back in order
+        future = Future()
+        if self.transport is None or self.transport.closing:
+            resolve(future, exception=ConnectionError('not connected'))
+            return future
+        self.replies.expect(reply, future)
+        self.transport.write(data)
+        return future
+
+    def request(self, packet):
+        return self.send(packet.pack(), cmd.REPLIES[packet.cmd])
+
+    def connection_lost(self, reason=None):
+        if self.transport is None:
+            return
+        futures = self.replies.clear()
+        super().connection_lost(reason)
+        exception = ConnectionError(reason or 'connection lost')
+        for future in futures:
+            resolve(future, exception=exception)
+        self.factory.lost(self)
+
+
+class ClientPool(Factory):
+
+    RECONNECT_DELAY = 0.05
+    MAX_RECONNECT_DELAY = 5.0
+
+    def __init__(self, eventloop, host, port, size=1, protocol=ClientProtocol,
+                 read_budget=None, *, sessions=False, reconnect=True,
+                 unix=None):
+        super().__init__(eventloop, protocol, read_budget)
+        self.family = socket.AF_UNIX if unix else socket.AF_INET
+        self.address = unix or (host, port)
+        self.size = size
+        self.sessions = sessions
+        self.reconnect = reconnect
+        self.delay = self.RECONNECT_DELAY
+        self.connections = []
+        self.probing = deque()
+        # sessions of our own connections, never mistaken for a reply
+        self.claimed = set()
+        self.turn = 0
+        self.closed = False
+        # resolved with the pool once size connections are up
+        self.ready = Future()
+
+    def create_server(self):
+        return None
+
+    def start(self):
+        for i in range(self.size):
+            self.connect()
+
+    def connect(self, eventloop=None):
+        if self.closed:
+            return
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        # a full unix backlog answers EAGAIN, retried like a refusal
+        error = sock.connect_ex(self.address)
+        if error not in (0, errno.EINPROGRESS):
+            sock.close()
+            self.failed(OSError(error, os.strerror(error)))
+            return
+        self.eventloop.handlers[sock.fileno()] = partial(self.connected, sock)
+        self.eventloop.poller.register(sock, EPOLLOUT | EPOLLHUP | EPOLLERR)
+
+    def connected(self, sock, event):
+        fd = sock.fileno()
+        self.eventloop.poller.unregister(fd)
+        del self.eventloop.handlers[fd]
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error or self.closed:
+            sock.close()
+            self.failed(OSError(error, os.strerror(error)))
+            return
+        self.delay = self.RECONNECT_DELAY
+        protocol = self.create_protocol(sock)
+        self.eventloop.handlers[fd] = protocol.transport
+        self.eventloop.poller.register(sock, Transport.READ_MASK)
+        protocol.connection_made()
+        if not self.sessions:
+            self.add(protocol)
+            return
+        # one CONNECT at a time, or the other sessions' broadcasts could
+        # be taken for the reply
+        self.probing.append(protocol)
+        if len(self.probing) == 1:
+            self.probe()
+
+    def probe(self):
+        self.probing[0].request(Connect()).add_done_callback(self.probed)
+
+    def probed(self, future):
+        protocol = self.probing.popleft()
+        if not future.cancelled() and future.exception() is None:
+            self.add(protocol)
+        if self.probing:
+            self.probe()
+
+    def add(self, protocol):
+        self.connections.append(protocol)
+        if protocol.session is not None:
+            self.claimed.add(protocol.session)
+        if len(self.connections) >= self.size and not self.ready.done():
+            resolve(self.ready, self)
+
+    def failed(self, exception):
+        if not self.reconnect:
+            if not self.ready.done():
+                resolve(self.ready, exception=exception)
+            return
+        self.eventloop.call_later(self.delay, self.connect)
+        self.delay = min(self.delay * 2, self.MAX_RECONNECT_DELAY)
+
+    def lost(self, protocol):
+        if protocol in self.connections:
+            self.connections.remove(protocol)
+        if protocol in self.probing:
+            self.probing.remove(protocol)
+        self.claimed.discard(protocol.session)
+        if not self.closed:
+            self.failed(ConnectionError('connection lost'))
+
+    def send(self, data, reply):
+        connections = self.connections
+        if not connections:
+            future = Future()
+            resolve(future, exception=ConnectionError('not connected'))
+            return future
+        self.turn = (self.turn + 1) % len(connections)
+        return connections[self.turn].send(data, reply)
+
+    def request(self, packet):
+        return self.send(packet.pack(), cmd.REPLIES[packet.cmd])
+
+    def request_threadsafe(self, packet):
+        future = Future()
+        self.eventloop.call_soon_threadsafe(self.forward, packet, future)
+        return future
+
+    def forward(self, eventloop, packet, future):
+        self.request(packet).add_done_callback(partial(chain, future))
+
+    def close(self):
+        self.closed = True
+        for protocol in list(self.clients.values()):
+            if protocol.transport:
+                protocol.transport.close()
@@ -5,5 +5,48 @@ def get_cmd_args():
     parser = argparse.ArgumentParser(prog='sockets')
     parser.add_argument('-host', default='', help='host')
     parser.add_argument('-port', default=50007, type=int, help='port')
+    parser.add_argument('-unix', default=None,
+                        help='unix socket path, used instead of host and '
+                             'port')
+    parser.add_argument('-udp-port', default=0, type=int,
+                        help='also answer PING and PINGD datagrams on this '
+                             'UDP port, 0 to disable')
+    parser.add_argument('-policy', default='drop',
+                        choices=['drop', 'disconnect', 'coalesce'],
+                        help='slow consumer policy for broadcasts')
+    parser.add_argument('-high-water', default=1024 * 1024, type=int,
+                        help='pending bytes before a client is slow')
+    parser.add_argument('-timers', default='heap', choices=['heap', 'wheel'],
+                        help='timer backend of the event loop')
+    parser.add_argument('-tick', default=0.01, type=float,
+                        help='timing wheel resolution, seconds')
+    parser.add_argument('-backend', default='native',
+                        choices=['native', 'asyncio'],
+                        help='event loop running the async server')
+    parser.add_argument('-stats-interval', default=0, type=float,
+                        help='seconds between metrics dumps to the log, '
+                             '0 to disable')
+    parser.add_argument('-profile', action='store_true',
+                        help='time every handler, sample stacks and write '
+                             'collapsed stacks on SIGUSR1')
+    parser.add_argument('-slow-callback', default=0.1, type=float,
+                        help='seconds a handler may run before it is logged, '
+                             'with -profile')
+    parser.add_argument('-sample-interval', default=0.01, type=float,
+                        help='seconds between stack samples, 0 to disable, '
+                             'with -profile')
+    parser.add_argument('-workers', '--workers', default=0, type=int,
+                        help='worker processes sharing the port, 0 to serve '
+                             'from this process')
+    parser.add_argument('-pool', default=0, type=int,
+                        help='sync server worker pool size, 0 for a thread '
+                             'per connection')
+    parser.add_argument('-batch', default=None,
+                        help='client command file, - for stdin, sent '
+                             'pipelined instead of asking interactively')
+    parser.add_argument('-window', default=64, type=int,
+                        help='commands in flight in client batch mode')
+    parser.add_argument('-backlog', default=5, type=int,
+                        help='listen backlog of the sync server')
     args = parser.parse_args()
     return args
\ No newline at end of file
@@ -0,0 +1,117 @@
+from struct import Struct
+
+from .fields import Cmd, Str
+from .exceptions import ValidationError
+
+
+BYTE_ORDER = '<'
+LENGTH = Struct(BYTE_ORDER + 'I')
+
+
+class _Source:
+
+    def __init__(self, header):
+        self.lines = [header]
+        self.namespace = {'ValidationError': ValidationError}
+
+    def struct(self, fmt):
+        name = '_s{}'.format(len(self.namespace))
+        self.namespace[name] = Struct(BYTE_ORDER + fmt)
+        return name, self.namespace[name]
+
+    def emit(self, line):
+        self.lines.append('    ' + line)
+
+    def compile(self, name, **namespace):
+        self.namespace.update(namespace)
+        exec('\n'.join(self.lines), self.namespace)
+        return self.namespace[name]
+
+
+def _segments(fields):
+    # runs of fixed-size fields, each closed by a string field
+    fixed, segments = [], []
+    for attr, field in fields.items():
+        if isinstance(field, Str):
+            segments.append((fixed, attr))
+            fixed = []
+        else:
+            fixed.append((attr, field))
+    segments.append((fixed, None))
+    return segments
+
+
+def compile_pack(fields):
+    source = _Source('def pack(self):')
+    parts, strings, size = [], [], 0
+    for i, (fixed, attr) in enumerate(_segments(fields)):
+        fmt = ''.join(field.fmt for _, field in fixed)
+        args = [repr(field.id) if isinstance(field, Cmd) else 'self.' + name
+                for name, field in fixed]
+        if attr is not None:
+            value = '_b{}'.format(len(strings))
+            source.emit("{} = self.{}.encode('utf-8')".format(value, attr))
+            fmt += LENGTH.format[-1]
+            args.append('len({})'.format(value))
+            strings.append(value)
+        if i == 0:
+            fmt = LENGTH.format[-1] + fmt
+            args.insert(0, '_length')
+        if fmt:
+            name, struct = source.struct(fmt)
+            parts.append('{}.pack({})'.format(name, ', '.join(args)))
+            size += struct.size
+        if attr is not None:
+            parts.append(strings[-1])
+
+    body = size - LENGTH.size
+    if not strings:
+        frame = eval(parts[0], source.namespace, {'_length': body})
+        source.emit('return _frame')
+        return source.compile('pack', _frame=frame)
+
+    source.emit('_length = {} + {}'.format(
+        body, ' + '.join('len({})'.format(value) for value in strings)))
+    if len(parts) == 2:
+        source.emit('return {} + {}'.format(*parts))
+    else:
+        source.emit("return b''.join(({}))".format(', '.join(parts)))
+    return source.compile('pack')
+
+
+def compile_unpack(cls, fields):
+    source = _Source('def unpack(data):')
+    offset, kwargs = 0, []
+    for fixed, attr in _segments(fields):
+        fmt = ''.join(field.fmt for _, field in fixed)
+        targets = ['_' if isinstance(field, Cmd) else name
+                   for name, field in fixed]
+        if attr is not None:
+            fmt += LENGTH.format[-1]
+            targets.append('_n')
+        kwargs += [name for name in targets if name not in ('_', '_n')]
+        if fmt:
+            name, struct = source.struct(fmt)
+            source.emit('{}, = {}.unpack_from(data, {})'.format(
+                ', '.join(targets), name, offset))
+            if isinstance(offset, int):
+                offset += struct.size
+            else:
+                offset = '{} + {}'.format(offset, struct.size)
+        if attr is not None:
+            source.emit('_o = {}'.format(offset))
+            source.emit('_e = _o + _n')
+            source.emit('if _e > len(data):')
+            source.emit('    raise ValidationError()')
+            source.emit("{} = str(data[_o:_e], 'utf-8')".format(attr))
+            source.emit('if len({}) > {}:'.format(attr, fields[attr].maxsize))
+            source.emit('    raise ValidationError()')
+            kwargs.append(attr)
+            offset = '_e'
+
+    # decoded values already have the right types, so skip __init__
+    source.emit('_p = _new(cls)')
+    for name in kwargs:
+        source.emit('_p.{0} = {0}'.format(name))
+    source.emit('return _p')
+    return source.compile('unpack', cls=cls, _new=object.__new__)
@@ -0,0 +1,87 @@
+import socket
+from select import EPOLLIN
+
+from .models import cmd
+from .protocol import unpack_frame
+from .exceptions import ValidationError
+
+
+class DatagramServer:
+
+    # replies that need no connection or session state
+    COMMANDS = frozenset((cmd.PING, cmd.PINGD))
+    MAX_DATAGRAM = 64 * 1024
+    READ_BATCH = 64
+
+    def __init__(self, eventloop, commands=COMMANDS):
+        self.eventloop = eventloop
+        self.commands = commands
+        self.socket = None
+        self.in_buffer = bytearray(self.MAX_DATAGRAM)
+        self.in_view = memoryview(self.in_buffer)
+        self.stats = dict.fromkeys(('bursts', 'received', 'replied',
+                                    'invalid', 'ignored', 'dropped'), 0)
+
+    def listen(self, host, port, reuse_port=False):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setblocking(False)
+        sock.bind((host, port))
+        self.socket = sock
+        self.eventloop.handlers[sock.fileno()] = self
+        # level-triggered: whatever is left past the batch wakes us again
+        self.eventloop.poller.register(sock, EPOLLIN)
+
+    def read_burst(self):
+        sock, view = self.socket, self.in_view
+        stats, commands = self.stats, self.commands
+        replies = []
+        received = 0
+        for i in range(self.READ_BATCH):
+            try:
+                size, addr = sock.recvfrom_into(view)
+            except BlockingIOError:
+                break
+            stats['received'] += 1
+            received += size
+            try:
+                packet = unpack_frame(view[:size])
+            except (ValidationError, UnicodeDecodeError):
+                stats['invalid'] += 1
+                continue
+            if packet.cmd not in commands:
+                stats['ignored'] += 1
+                continue
+            replies.append((packet.reply(), addr))
+        return replies, received
+
+    def send_replies(self, replies):
+        # Python has no sendmmsg, so the burst goes out back to back; a
+        # full send buffer drops the reply as the network could have
+        sock, stats = self.socket, self.stats
+        sent = 0
+        for data, addr in replies:
+            try:
+                sent += sock.sendto(data, addr)
+            except OSError:
+                stats['dropped'] += 1
+            else:
+                stats['replied'] += 1
+        return sent
+
+    def __call__(self, event):
+        replies, received = self.read_burst()
+        sent = self.send_replies(replies)
+        self.stats['bursts'] += 1
+        counters = self.eventloop.metrics.counters
+        counters['bytes_in'] += received
+        counters['bytes_out'] += sent
+        counters['frames_in'] += len(replies)
+        counters['frames_out'] += len(replies)
+
+    def close(self):
+        self.eventloop.poller.unregister(self.socket.fileno())
+        del self.eventloop.handlers[self.socket.fileno()]
+        self.socket.close()
@@ -1,12 +1,15 @@
 import logging
-from numbers import Number
 from inspect import signature
-from functools import total_ordering
 
 
-@total_ordering
 class DelayedCall:
 
+    __slots__ = ('eventloop', 'when', 'callback', 'args', 'cancelled',
+                 'timers')
+
+    CACHE_SIZE = 1024
+    _validated = {}
+
     def __new__(cls, eventloop, when, callback, args, *, check_args=True):
         if check_args:
             if not cls.validate_args(callback, args):
@@ -19,9 +22,27 @@ class DelayedCall:
         self.callback = callback
         self.args = args
         self.cancelled = False
+        self.timers = None
+
+    @classmethod
+    def validate_args(cls, callback, args):
+        key = (getattr(callback, '__func__', callback),
+               hasattr(callback, '__self__'), len(args))
+        try:
+            return cls._validated[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return cls.check_signature(callback, args)
+
+        valid = cls.check_signature(callback, args)
+        if len(cls._validated) >= cls.CACHE_SIZE:
+            cls._validated.clear()
+        cls._validated[key] = valid
+        return valid
 
     @staticmethod
-    def validate_args(callback, args):
+    def check_signature(callback, args):
         try:
             assert callable(callback), ('callback should be any callable, '
                                         'got {!r}'.format(callback))
@@ -33,24 +54,14 @@ class DelayedCall:
         else:
             return True
 
-    def __eq__(self, other):
-        if isinstance(other, Number):
-            return self.when == other
-        if not isinstance(other, DelayedCall):
-            return NotImplemented
-        return (self.when == other.when and
-                self.callback == other.callback and
-                self.args == other.args)
-
     def __lt__(self, other):
-        if isinstance(other, Number):
-            return self.when < other
-        if not isinstance(other, DelayedCall):
-            return NotImplemented
         return self.when < other.when
 
     def __call__(self):
         self.callback(self.eventloop, *self.args)
 
     def cancel(self):
-        self.cancelled = True
\ No newline at end of file
+        if not self.cancelled:
+            self.cancelled = True
+            if self.timers is not None:
+                self.timers.cancel(self)
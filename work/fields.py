@@ -4,30 +4,30 @@ from .exceptions import ValidationError
 class Field:
     _type = NotImplemented
 
-    def __get__(self, instance, owner):
-        if instance is None:
-            return self
-        return instance.__dict__[self.name]
-
-    def __set__(self, instance, value):
-        if value.__class__ != self._type:
+    def clean(self, value):
+        if value.__class__ is not self._type:
             raise ValidationError()
-        if hasattr(self, 'validate'):
-            self.validate(value)
-        instance.__dict__[self.name] = value
+        return value
 
 
 class Cmd(Field):
     _type = int
+    fmt = 'B'
     serialize = staticmethod(lambda x: x.to_bytes(1, 'little'))
     deserialize = staticmethod(lambda data: (data[0], data[1:]))
 
     def __init__(self, _id):
         self.id = _id
 
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return self.id
+
 
 class Int(Field):
     _type = int
+    fmt = 'I'
 
     @staticmethod
     def serialize(value):
@@ -44,9 +44,10 @@ class Str(Field):
     def __init__(self, maxsize):
         self.maxsize = maxsize
 
-    def validate(self, value):
-        if len(value) > self.maxsize:
+    def clean(self, value):
+        if value.__class__ is not str or len(value) > self.maxsize:
             raise ValidationError()
+        return value
 
     @staticmethod
     def serialize(value):
@@ -57,4 +58,4 @@ class Str(Field):
     def deserialize(value):
         _len, tail = Int.deserialize(value)
         data, tail = tail[:_len], tail[_len:]
-        return (data.decode('utf-8'), tail)
\ No newline at end of file
+        return (str(data, 'utf-8'), tail)
\ No newline at end of file
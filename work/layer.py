@@ -1,93 +1,294 @@
 import abc
+import time
 import socket
-from select import EPOLLIN, EPOLLOUT, EPOLLHUP, EPOLLERR
+from itertools import islice
+from collections import deque, OrderedDict
+from select import EPOLLIN, EPOLLOUT, EPOLLET, EPOLLHUP, EPOLLERR
 
 from .protocol import feed
+from .utils import unlink_socket
 
 
 class Transport:
 
-    CHUNK_SIZE = 1024
+    BUFFER_SIZE = 4096
+    MIN_BUFFER_SIZE = 1024
+    MAX_BUFFER_SIZE = 256 * 1024
+    SHRINK_AFTER = 16
+    READ_BUDGET = 256 * 1024
+    IOV_MAX = 1024
+    READ_MASK = EPOLLIN | EPOLLET | EPOLLHUP | EPOLLERR
+    WRITE_MASK = READ_MASK | EPOLLOUT
 
-    def __init__(self, eventloop):
+    def __init__(self, eventloop, read_budget=None):
         self.conn = None
         self.eventloop = eventloop
-        self.in_buffer = bytearray()
-        self.out_buffer = bytearray()
+        self.read_budget = read_budget or self.READ_BUDGET
+        self.set_buffer_size(self.BUFFER_SIZE)
+        self.small_reads = 0
+        self.out_queue = deque()
+        self.pending = 0
+        self.writing = False
+        self.closing = False
+        self.parked = None
+        self.bytes_in = self.bytes_out = 0
+        self.frames_in = self.frames_out = 0
 
-    def write(self, data):
-        self.out_buffer += data
+    def set_buffer_size(self, size):
+        self.in_buffer = bytearray(size)
+        self.in_view = memoryview(self.in_buffer)
 
-    def abort(self):
-        self.eventloop.poller.unregister(self.conn.fileno())
-        self.eventloop.handlers.pop(self.conn.fileno(), None)
-        self.protocol.factory.clients.remove(self.protocol)
-        self.conn.close()
+    def adapt_buffer(self, received):
+        size = len(self.in_buffer)
+        if received == size:
+            self.small_reads = 0
+            if size < self.MAX_BUFFER_SIZE:
+                self.set_buffer_size(size * 2)
+        elif received <= size // 4 and size > self.MIN_BUFFER_SIZE:
+            self.small_reads += 1
+            if self.small_reads >= self.SHRINK_AFTER:
+                self.small_reads = 0
+                self.set_buffer_size(size // 2)
+        else:
+            self.small_reads = 0
 
-    def __call__(self, event):
-        if any(event & e for e in (EPOLLHUP, EPOLLERR)):
-            return
-        if event & EPOLLIN:
-            while True:
-                try:
-                    _input = self.conn.recv(self.CHUNK_SIZE)
-                    if not _input:
-                        break
-                    self.in_buffer += _input
-                except BlockingIOError:
-                    pass
-                except OSError as exc:
-                    self.protocol.connection_lost(exc)
-                    break
+    def read_ready(self):
+        budget = self.read_budget
+        while budget > 0:
+            try:
+                received = self.conn.recv_into(self.in_view)
+            except BlockingIOError:
+                return
+            except OSError as exc:
+                self.protocol.connection_lost(exc)
+                return
+            if not received:
+                self.protocol.connection_lost()
+                return
+            budget -= received
+            self.bytes_in += received
+            self.protocol.data_received(self.in_view[:received])
+            if self.conn is None:
+                return
+            self.adapt_buffer(received)
 
-            self.protocol.data_received(self.in_buffer)
-            self.in_buffer.clear()
-        if event & EPOLLOUT:
+        # edge-triggered: nothing wakes us for the rest, so come back later
+        self.eventloop.call_soon(self.resume_reading)
+
+    def resume_reading(self, eventloop):
+        if self.conn is not None:
+            self.read_ready()
+
+    def write(self, data):
+        # data is queued by reference and must not be mutated afterwards
+        if data and self.conn is not None:
+            self.out_queue.append(memoryview(data))
+            self.pending += len(data)
+            self.frames_out += 1
+            if not self.writing:
+                self.write_ready()
+
+    def write_ready(self):
+        while True:
             try:
-                sent = self.conn.send(self.out_buffer)
-                self.out_buffer = self.out_buffer[sent:]
+                self.flush()
             except BlockingIOError:
                 pass
             except OSError as exc:
                 self.protocol.connection_lost(exc)
+                return
+            if self.out_queue or not self.parked:
+                break
+            self.unpark()
+
+        if self.out_queue:
+            self.eventloop.metrics.histograms['out_queue'].add(self.pending)
+            if not self.writing:
+                self.eventloop.poller.modify(self.conn, self.WRITE_MASK)
+                self.writing = True
+        else:
+            if self.writing:
+                self.eventloop.poller.modify(self.conn, self.READ_MASK)
+                self.writing = False
+            if self.closing:
+                self.protocol.connection_lost()
+
+    def park(self, data, limit):
+        # hold a frame back until the queue drains, a duplicate collapses
+        # into the one already parked
+        if self.parked is None:
+            self.parked = OrderedDict()
+        parked = self.parked
+        if data in parked:
+            return True
+        parked[data] = None
+        if len(parked) > limit:
+            parked.popitem(last=False)
+            return False
+        return True
+
+    def count_frames(self, count):
+        self.frames_in += count
+
+    def unpark(self):
+        parked, self.parked = self.parked, None
+        for data in parked:
+            self.out_queue.append(memoryview(data))
+            self.pending += len(data)
+        self.frames_out += len(parked)
+
+    def flush(self):
+        queue = self.out_queue
+        while queue:
+            if len(queue) == 1:
+                sent = self.conn.send(queue[0])
+            else:
+                sent = self.conn.sendmsg(islice(queue, self.IOV_MAX))
+            self.pending -= sent
+            self.bytes_out += sent
+            while sent:
+                head = queue[0]
+                if sent < len(head):
+                    queue[0] = head[sent:]
+                    break
+                sent -= len(head)
+                queue.popleft()
+
+    def close(self):
+        self.closing = True
+        if not self.out_queue:
+            self.protocol.connection_lost()
+
+    def abort(self):
+        # per-connection counters only reach the loop totals here, which
+        # keeps the hot paths to one attribute increment
+        self.eventloop.metrics.add_counters(self)
+        fd = self.conn.fileno()
+        self.eventloop.poller.unregister(fd)
+        self.eventloop.handlers.pop(fd, None)
+        self.protocol.factory.clients.pop(fd, None)
+        self.conn.close()
+        self.conn = None
+
+    def __call__(self, event):
+        if event & (EPOLLIN | EPOLLHUP | EPOLLERR):
+            self.read_ready()
+        if event & EPOLLOUT and self.writing and self.conn is not None:
+            self.write_ready()
 
 
 class Factory:
 
-    MAX_CONN = 5
+    MAX_CONN = socket.SOMAXCONN
+    ACCEPT_BATCH = 64
+    DROP, DISCONNECT, COALESCE = POLICIES = ('drop', 'disconnect', 'coalesce')
+    HIGH_WATER = 1024 * 1024
+    COALESCE_LIMIT = 64
+    FINISH_GRACE = 1.0
+    FINISH_POLL = 0.01
 
-    def __init__(self, eventloop, protocol):
+    def __init__(self, eventloop, protocol, read_budget=None, *,
+                 policy=DROP, high_water=HIGH_WATER,
+                 coalesce_limit=COALESCE_LIMIT):
+        if policy not in self.POLICIES:
+            raise ValueError(
+                'Unknown slow consumer policy {!r}'.format(policy))
         self.eventloop = eventloop
         self.protocol = protocol
+        self.read_budget = read_budget
+        self.policy = policy
+        self.high_water = high_water
+        self.coalesce_limit = coalesce_limit
+        self.family = socket.AF_INET
+        self.path = None
         self.socket = self.create_server()
-        self.clients = []
+        self.clients = {}
+        self.stats = dict.fromkeys(('broadcasts', 'frames', 'dropped',
+                                    'disconnected', 'coalesced'), 0)
+        self.stats.update(fanout_time=0.0, fanout_max=0.0)
 
     def create_server(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setblocking(False)
         return sock
 
     def listen(self, host, port):
-        self.socket.bind((host, port))
+        self.bind((host, port))
+
+    def listen_unix(self, path):
+        # the TCP socket made up front is replaced, nothing else changes
+        self.socket.close()
+        self.family = socket.AF_UNIX
+        self.socket = self.create_server()
+        unlink_socket(path)
+        self.path = path
+        self.bind(path)
+
+    def bind(self, address):
+        self.socket.bind(address)
         self.eventloop.register_factory(self)
         self.socket.listen(self.MAX_CONN)
 
-    def create_protocol(self):
-        transport  = Transport(self.eventloop)
+    def create_protocol(self, conn):
+        transport = Transport(self.eventloop, self.read_budget)
         protocol = self.protocol(transport)
-        self.clients.append(protocol)
+        transport.conn, transport.protocol = conn, protocol
         protocol.factory = self
+        self.clients[conn.fileno()] = protocol
         return protocol
 
+    def broadcast(self, data):
+        started = time.monotonic()
+        stats, high_water = self.stats, self.high_water
+        for protocol in list(self.clients.values()):
+            transport = protocol.transport
+            if transport is None or transport.closing:
+                continue
+            # parked frames go first, so stay behind them until they do
+            if transport.pending < high_water and not transport.parked:
+                transport.write(data)
+                stats['frames'] += 1
+            elif self.policy == self.DISCONNECT:
+                protocol.connection_lost()
+                stats['disconnected'] += 1
+            elif self.policy == self.COALESCE:
+                if transport.park(data, self.coalesce_limit):
+                    stats['coalesced'] += 1
+                else:
+                    stats['dropped'] += 1
+            else:
+                stats['dropped'] += 1
+
+        elapsed = time.monotonic() - started
+        stats['broadcasts'] += 1
+        stats['fanout_time'] += elapsed
+        if elapsed > stats['fanout_max']:
+            stats['fanout_max'] = elapsed
+
     def close(self):
         poller = self.eventloop.poller
         poller.unregister(self.socket.fileno())
         self.socket.close()
-        for protocol in self.clients[:]:
-            conn = protocol.transport.conn
-            poller.unregister(conn.fileno())
-            client.close()
+        if self.path is not None:
+            unlink_socket(self.path)
+        for protocol in list(self.clients.values()):
+            if protocol.transport:
+                protocol.transport.close()
+
+    def finish(self):
+        # stop serving, and stop the loop once the clients have drained
+        # what was queued for them, or after FINISH_GRACE
+        self.close()
+        self.eventloop.call_soon(self.stop_drained,
+                                 time.monotonic() + self.FINISH_GRACE)
+
+    def stop_drained(self, eventloop, deadline):
+        if self.clients and time.monotonic() < deadline:
+            eventloop.call_later(self.FINISH_POLL, self.stop_drained,
+                                 deadline)
+        else:
+            eventloop.stop()
 
 
 class Protocol(metaclass=abc.ABCMeta):
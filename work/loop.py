@@ -1,64 +1,95 @@
+import os
 import time
-import heapq
-import threading
 from functools import partial
-from select import epoll, EPOLLIN, EPOLLOUT, EPOLLET, EPOLLHUP, EPOLLERR
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from select import epoll, EPOLLIN, EPOLLHUP, EPOLLERR
 
+from .timers import HeapTimers
+from .metrics import Metrics
 from .delayedcall import DelayedCall
 
 
+WAKEUP = (1).to_bytes(8, 'little')
+
+
 class TimeLoop:
 
     DEFAULT_TIMEOUT = 1
 
-    def __init__(self):
+    def __init__(self, timers=None, check_args=True):
         self._running = False
-        self._soon = []
-        self._later = []
+        self.check_args = check_args
+        self._soon = deque()
+        self._later = timers if timers is not None else HeapTimers()
         self.timeout = self.DEFAULT_TIMEOUT
-        self._soon_lock = threading.RLock()
+        self.profiler = None
+        # only touched from the loop thread, so no locking
+        self.metrics = Metrics(
+            counters=('bytes_in', 'bytes_out', 'frames_in', 'frames_out'),
+            timings=('poll_wait', 'callback_time', 'timer_lag'),
+            sizes=('events', 'out_queue'))
 
     def run(self):
         self._running = True
 
     def process_delayed_calls(self):
-        with self._soon_lock:
-            soon = self._soon
-            self._soon = []
+        self.run_delayed_calls()
+        self.update_timeout()
+
+    def run_delayed_calls(self):
+        # other threads may append meanwhile; those run next iteration
+        popleft = self._soon.popleft
+        soon = [popleft() for i in range(len(self._soon))]
+        ready = len(soon)
 
         now = time.monotonic()
-        try:
-            dc = heapq.heappop(self._later)
-            while dc <= now:
-                if not dc.cancelled:
-                    soon.append(dc)
-                dc = heapq.heappop(self._later)
-            else:
-                self.timeout = dc.when - now
-                heapq.heappush(self._later, dc)
-        except IndexError:
-            self.timeout = self.DEFAULT_TIMEOUT
+        self._later.pop_due(now, soon)
+        if len(soon) > ready:
+            lag = self.metrics.histograms['timer_lag'].buckets
+            for dc in soon[ready:]:
+                lag[int((now - dc.when) * 1e6).bit_length()] += 1
 
+        profiler = self.profiler
         for dc in soon:
             if not dc.cancelled:
-                dc()
+                if profiler is None:
+                    dc()
+                else:
+                    profiler.run('timers', dc)
+        return len(soon)
+
+    def update_timeout(self):
         if self._soon:
             self.timeout = 0
+        else:
+            self.timeout = self._later.next_timeout(time.monotonic(),
+                                                    self.DEFAULT_TIMEOUT)
 
     def stop(self):
         self._running = False
 
     def call_soon(self, cb, *args):
-        dcall = DelayedCall(self, time.monotonic(), cb, args)
+        dcall = DelayedCall(self, time.monotonic(), cb, args,
+                            check_args=self.check_args)
         if dcall is not None:
-            with self._soon_lock:
-                heapq.heappush(self._soon, dcall)
+            self._soon.append(dcall)
             return dcall
 
+    def call_soon_threadsafe(self, cb, *args):
+        dcall = self.call_soon(cb, *args)
+        if dcall is not None:
+            self.wakeup()
+        return dcall
+
+    def wakeup(self):
+        pass
+
     def call_later(self, delay, cb, *args):
-        dcall = DelayedCall(self, time.monotonic() + delay, cb, args)
+        dcall = DelayedCall(self, time.monotonic() + delay, cb, args,
+                            check_args=self.check_args)
         if dcall is not None:
-            heapq.heappush(self._later, dcall)
+            self._later.push(dcall)
             return dcall
 
 
@@ -66,30 +97,111 @@ def accept(factory, event):
     if event in (EPOLLHUP, EPOLLERR):
         return
 
-    EDGE_MASK = EPOLLIN | EPOLLOUT | EPOLLET | EPOLLHUP | EPOLLERR
     eventloop = factory.eventloop
-    conn, addr = factory.socket.accept()
-    conn.setblocking(False)
-    protocol = factory.create_protocol()
-    protocol.connection_made()
-    transport = protocol.transport
-    transport.conn, transport.protocol = conn, protocol
-    eventloop.handlers[conn.fileno()] = transport
-    eventloop.poller.register(conn, EDGE_MASK)
+    for i in range(factory.ACCEPT_BATCH):
+        try:
+            conn, addr = factory.socket.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        protocol = factory.create_protocol(conn)
+        transport = protocol.transport
+        eventloop.handlers[conn.fileno()] = transport
+        eventloop.poller.register(conn, transport.READ_MASK)
+        protocol.connection_made()
 
 
 class EventLoop(TimeLoop):
 
-    def __init__(self):
-        super().__init__()
+    MAX_EVENTS = 1024
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, timers=None, max_events=MAX_EVENTS, check_args=True,
+                 process_workers=None):
+        super().__init__(timers, check_args)
         self.poller = epoll()
         self.handlers = {}
-        self._executors = []
+        self.max_events = max_events
+        self.process_workers = process_workers
+        self._executors = set()
+        self._default_executor = None
+        self._process_executor = None
+        self.executor_stats = dict.fromkeys(('submitted', 'completed',
+                                             'pending', 'pending_max'), 0)
+        self.executor_stats.update(latency=0.0, latency_max=0.0)
+        self.iterations = 0
+        self.phase_times = dict.fromkeys(('poll', 'io', 'timers', 'timeout'),
+                                         0.0)
+        histograms = self.metrics.histograms
+        self._poll_wait = histograms['poll_wait'].buckets
+        self._events = histograms['events'].buckets
+        self._callback_time = histograms['callback_time'].buckets
+        self._wakeup_pending = False
+        self._create_wakeup()
+
+    def _create_wakeup(self):
+        if hasattr(os, 'eventfd'):
+            fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self._wakeup_fds = (fd, fd)
+        else:
+            self._wakeup_fds = os.pipe()
+            for fd in self._wakeup_fds:
+                os.set_blocking(fd, False)
+        self.handlers[self._wakeup_fds[0]] = self._read_wakeup
+        self.poller.register(self._wakeup_fds[0], EPOLLIN)
+
+    def wakeup(self):
+        if self._wakeup_pending:
+            return
+        self._wakeup_pending = True
+        try:
+            os.write(self._wakeup_fds[1], WAKEUP)
+        except BlockingIOError:
+            pass
+
+    def _read_wakeup(self, event):
+        try:
+            while os.read(self._wakeup_fds[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+        # cleared after draining: callbacks queued before this point run
+        # in this iteration, later ones write a fresh wakeup
+        self._wakeup_pending = False
 
     def run_once(self, timeout):
-        for (fd, event) in self.poller.poll(timeout):
-            self.handlers[fd](event)
-            self.process_delayed_calls()
+        started = time.monotonic()
+        events = self.poller.poll(timeout, self.max_events)
+        polled = time.monotonic()
+        self._poll_wait[int((polled - started) * 1e6).bit_length()] += 1
+        self._events[len(events).bit_length()] += 1
+
+        handlers, profiler = self.handlers, self.profiler
+        for fd, event in events:
+            handler = handlers.get(fd)
+            if handler is not None:
+                if profiler is None:
+                    handler(event)
+                else:
+                    profiler.run('io', handler, event)
+        handled = time.monotonic()
+
+        called = self.run_delayed_calls()
+        delayed = time.monotonic()
+        if called:
+            # the whole batch, from the phase clock already taken
+            self._callback_time[
+                int((delayed - handled) * 1e6).bit_length()] += 1
+
+        self.update_timeout()
+        finished = time.monotonic()
+
+        phase_times = self.phase_times
+        phase_times['poll'] += polled - started
+        phase_times['io'] += handled - polled
+        phase_times['timers'] += delayed - handled
+        phase_times['timeout'] += finished - delayed
+        self.iterations += 1
 
     def run(self):
         super().run()
@@ -97,15 +209,66 @@ class EventLoop(TimeLoop):
             self.run_once(self.timeout)
 
     def stop(self):
-        super.stop()
+        super().stop()
+        self.wakeup()
         for executor in self._executors:
             executor.shutdown(wait=False)
+        self._executors.clear()
+        self._default_executor = self._process_executor = None
+
+    def close(self):
+        self.poller.close()
+        for fd in set(self._wakeup_fds):
+            os.close(fd)
 
-    def run_in_executor(self, executor, cb, *args):
+    def default_executor(self):
+        if self._default_executor is None:
+            self._default_executor = ThreadPoolExecutor(self.DEFAULT_WORKERS)
+            self._executors.add(self._default_executor)
+        return self._default_executor
+
+    def process_executor(self):
+        if self._process_executor is None:
+            self._process_executor = ProcessPoolExecutor(self.process_workers)
+            self._executors.add(self._process_executor)
+        return self._process_executor
+
+    def run_in_executor(self, executor, cb, *args, callback=None):
+        if executor is None:
+            executor = self.default_executor()
+        else:
+            self._executors.add(executor)
         future = executor.submit(cb, self, *args)
-        self._executors.append(executor)
+        self._track(future, callback)
+        return future
+
+    def run_in_process(self, cb, *args, callback=None):
+        # cb and args are pickled, so the loop itself is not passed
+        future = self.process_executor().submit(cb, *args)
+        self._track(future, callback)
         return future
 
+    def _track(self, future, callback):
+        stats = self.executor_stats
+        stats['submitted'] += 1
+        stats['pending'] += 1
+        if stats['pending'] > stats['pending_max']:
+            stats['pending_max'] = stats['pending']
+        future.add_done_callback(partial(self.call_soon_threadsafe,
+                                         self._future_done, time.monotonic(),
+                                         callback))
+
+    def _future_done(self, eventloop, submitted, callback, future):
+        latency = time.monotonic() - submitted
+        stats = self.executor_stats
+        stats['pending'] -= 1
+        stats['completed'] += 1
+        stats['latency'] += latency
+        if latency > stats['latency_max']:
+            stats['latency_max'] = latency
+        if callback is not None:
+            callback(self, future)
+
     def register_factory(self, factory):
         self.handlers[factory.socket.fileno()] = partial(accept, factory)
         self.poller.register(factory.socket, EPOLLIN | EPOLLHUP | EPOLLERR)
\ No newline at end of file
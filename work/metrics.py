@@ -0,0 +1,96 @@
+import json
+import logging
+
+from .models import replies
+
+
+class Histogram:
+
+    # bucket i counts values below 2 ** i units; the hot paths bump
+    # buckets[int(value * scale).bit_length()] inline, which is all it takes
+    BUCKETS = 64
+    PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+    __slots__ = ('scale', 'buckets')
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, value):
+        self.buckets[int(value * self.scale).bit_length()] += 1
+
+    @property
+    def count(self):
+        return sum(self.buckets)
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th value, in units
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return 2 ** index
+        return 0
+
+    def snapshot(self):
+        result = {'count': self.count}
+        if result['count']:
+            for name, q in self.PERCENTILES:
+                result[name] = self.percentile(q)
+            result['max'] = self.percentile(1)
+        return result
+
+
+class Metrics:
+
+    # time histograms are kept in seconds and reported in microseconds
+    MICROSECONDS = 1e6
+
+    def __init__(self, counters=(), timings=(), sizes=()):
+        self.counters = dict.fromkeys(counters, 0)
+        self.histograms = {name: Histogram(self.MICROSECONDS)
+                           for name in timings}
+        self.histograms.update((name, Histogram()) for name in sizes)
+
+    def add_counters(self, source):
+        counters = self.counters
+        for name in counters:
+            counters[name] += getattr(source, name, 0)
+
+    def snapshot(self):
+        result = dict(self.counters)
+        for name, histogram in self.histograms.items():
+            result[name] = histogram.snapshot()
+        return result
+
+
+def snapshot(eventloop, factory=None, transport=None):
+    result = {}
+    metrics = getattr(eventloop, 'metrics', None)
+    if metrics is not None:
+        loop = result['loop'] = metrics.snapshot()
+        loop.update(iterations=eventloop.iterations,
+                    phase_times=dict(eventloop.phase_times),
+                    executor=dict(eventloop.executor_stats))
+        # closed connections are already counted, add the open ones
+        for protocol in getattr(factory, 'clients', {}).values():
+            if protocol.transport is not None:
+                for name in metrics.counters:
+                    loop[name] += getattr(protocol.transport, name, 0)
+    # the reply frame cache is shared by every connection in the process
+    result['replies'] = replies.stats()
+    if factory is not None:
+        result['factory'] = dict(factory.stats, clients=len(factory.clients))
+    if transport is not None:
+        result['connection'] = {name: getattr(transport, name, 0)
+                                for name in ('bytes_in', 'bytes_out',
+                                             'frames_in', 'frames_out',
+                                             'pending')}
+    return result
+
+
+def dump(eventloop, factory, interval):
+    logging.info('stats %s', json.dumps(snapshot(eventloop, factory)))
+    eventloop.call_later(interval, dump, factory, interval)
@@ -1,4 +1,4 @@
-from .protocol import Packet
+from .protocol import Packet, ReplyCache
 from .fields import Cmd, Str
 
 
@@ -15,6 +15,14 @@ class cmd:
     DELAYED = 10
     ACKQUIT = 11
     ACKFINISH = 12
+    STATS = 14
+    STATSREPLY = 15
+    # request -> the reply a client waits for
+    REPLIES = {CONNECT: CONNECTED, PING: PONG, PINGD: PONGD, DELAY: DELAYED,
+               QUIT: ACKQUIT, FINISH: ACKFINISH, STATS: STATSREPLY}
+
+
+replies = ReplyCache()
 
 
 class Connected(Packet):
@@ -45,18 +53,23 @@ class AckFinish(Packet):
     session = Str(maxsize=256)
 
 
+class StatsReply(Packet):
+    cmd = Cmd(cmd.STATSREPLY)
+    data = Str(maxsize=64 * 1024)
+
+
 class Connect(Packet):
     cmd = Cmd(cmd.CONNECT)
 
     def reply(self, session):
-        return Connected(session=session).pack()
+        return replies.session(Connected, session)
 
 
 class Ping(Packet):
     cmd = Cmd(cmd.PING)
 
     def reply(self):
-        return Pong().pack()
+        return replies.frame(Pong)
 
 
 class PingD(Packet):
@@ -78,11 +91,21 @@ class Quit(Packet):
     cmd = Cmd(cmd.QUIT)
 
     def reply(self, session):
-        return AckQuit(session=session).pack()
+        return replies.session(AckQuit, session)
 
 
 class Finish(Packet):
     cmd = Cmd(cmd.FINISH)
 
     def reply(self, session):
-        return AckFinish(session=session).pack()
\ No newline at end of file
+        return replies.session(AckFinish, session)
+
+
+class Stats(Packet):
+    cmd = Cmd(cmd.STATS)
+
+    def reply(self, data):
+        return StatsReply(data=data).pack()
+
+
+replies.preload(Pong)
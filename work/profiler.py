@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from functools import partial
+from collections import Counter
+
+from .delayedcall import DelayedCall
+
+
+def handler_name(handler):
+    if isinstance(handler, DelayedCall):
+        handler = handler.callback
+    while isinstance(handler, partial):
+        handler = handler.func
+    protocol = getattr(handler, 'protocol', None)
+    if protocol is not None:
+        return '{}[{}]'.format(type(handler).__name__,
+                               type(protocol).__name__)
+    return getattr(handler, '__qualname__', type(handler).__qualname__)
+
+
+def connection_name(handler):
+    if isinstance(handler, DelayedCall):
+        handler = getattr(handler.callback, '__self__', None)
+        handler = getattr(handler, 'transport', None)
+    conn = getattr(handler, 'conn', None)
+    if conn is None:
+        return '-'
+    try:
+        peer = conn.getpeername()
+    except OSError:
+        peer = None
+    return 'fd={} peer={}'.format(conn.fileno(), peer)
+
+
+def frame_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('{} ({}:{})'.format(code.co_name,
+                                         os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Profiler:
+
+    SLOW_CALLBACK = 0.1
+    SAMPLE_INTERVAL = 0.01
+
+    def __init__(self, eventloop, threshold=SLOW_CALLBACK,
+                 interval=SAMPLE_INTERVAL, directory='.'):
+        self.eventloop = eventloop
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        # (phase, handler name) -> [calls, total seconds, max seconds]
+        self.timings = {}
+        # written by the sampler thread, read on dumps
+        self.samples = Counter()
+        self.samples_lock = threading.Lock()
+        self.sampler = None
+        self.stopped = threading.Event()
+        self.signum = self.previous = None
+
+    def install(self, signum=None):
+        self.eventloop.profiler = self
+        if self.interval:
+            self.sampler = threading.Thread(target=self.sample,
+                                            args=(threading.get_ident(), ),
+                                            name='Sampler', daemon=True)
+            self.sampler.start()
+        if signum is not None:
+            self.signum = signum
+            self.previous = signal.signal(signum, self.signalled)
+
+    def uninstall(self):
+        self.eventloop.profiler = None
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        if self.signum is not None:
+            signal.signal(self.signum, self.previous)
+            self.signum = None
+
+    def run(self, phase, handler, *args):
+        started = time.monotonic()
+        try:
+            handler(*args)
+        finally:
+            elapsed = time.monotonic() - started
+            key = (phase, handler_name(handler))
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = [0, 0.0, 0.0]
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
+            if elapsed >= self.threshold:
+                logging.warning('slow %s callback %s (%s) took %.3f s',
+                                phase, key[1], connection_name(handler),
+                                elapsed)
+
+    def sample(self, ident):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                return
+            stack = frame_stack(frame)
+            del frame
+            with self.samples_lock:
+                self.samples[stack] += 1
+
+    def collapsed_timings(self):
+        # weights are microseconds spent, so the flame graph shows time
+        for (phase, name), (calls, total, longest) in sorted(
+                self.timings.items()):
+            yield 'run_once;{};{} {}'.format(phase, name, int(total * 1e6))
+
+    def collapsed_samples(self):
+        with self.samples_lock:
+            samples = sorted(self.samples.items())
+        for stack, count in samples:
+            yield '{} {}'.format(stack, count)
+
+    def dump(self):
+        paths = []
+        for kind, lines in (('handlers', self.collapsed_timings()),
+                            ('samples', self.collapsed_samples())):
+            path = os.path.join(self.directory, '{}-{}.folded'.format(
+                kind, os.getpid()))
+            with open(path, 'w') as f:
+                for line in lines:
+                    f.write(line + '\n')
+            paths.append(path)
+        logging.info('profile written to %s', ', '.join(paths))
+        return paths
+
+    def signalled(self, signum, frame):
+        # the loop may be halfway through a handler, write between them
+        self.eventloop.call_soon_threadsafe(self.dump_on_loop)
+
+    def dump_on_loop(self, eventloop):
+        self.dump()
@@ -1,6 +1,8 @@
+import struct
 from collections import OrderedDict
 
-from .fields import Field, Int, Cmd
+from .fields import Field, Cmd
+from .codec import compile_pack, compile_unpack
 from .exceptions import FieldDeclarationError, ValidationError
 
 
@@ -35,11 +37,26 @@ class MetaPacket(type):
     def __prepare__(name, bases):
         return Namespace(bases)
 
+    def __new__(mcs, name, bases, dct):
+        namespace = dict(dct)
+        if bases:
+            slots = []
+            for attr, field in dct._fields.items():
+                if attr not in dct or isinstance(field, Cmd):
+                    continue
+                del namespace[attr]
+                if not any(hasattr(base, attr) for base in bases):
+                    slots.append(attr)
+            namespace['__slots__'] = tuple(slots)
+        return type.__new__(mcs, name, bases, namespace)
+
     def __init__(cls, name, bases, dct):
         type.__init__(cls, name, bases, dct)
         if not bases: return
 
         cls._fields = dct._fields
+        cls._names = tuple(attr for attr, field in cls._fields.items()
+                           if not isinstance(field, Cmd))
 
         if not (cls._fields and isinstance(next(iter(cls._fields.values())), Cmd)):
             raise FieldDeclarationError('Command shoud be first field.')
@@ -48,59 +65,118 @@ class MetaPacket(type):
             raise FieldDeclarationError('Dublicate registered command.')
 
         cls.__class__.packets[dct._cmd.id] = cls
+        cls.pack = compile_pack(cls._fields)
+        cls._unpack = staticmethod(compile_unpack(cls, cls._fields))
 
 
 class Packet(metaclass=MetaPacket):
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
-        names = list(self._fields.keys())
-        cmd_name, names = names[0], names[1:]
-        cmd_val = self._fields[cmd_name]
-        cmd_val.__set__(self, cmd_val.id)
-        for attr in names:
+        fields = self._fields
+        for attr in self._names:
             value = kwargs.get(attr)
             if value is None:
                 raise ValidationError()
-            self._fields[attr].__set__(self, value)
-
-    def pack(self):
-        result = bytes()
-        for attr, _type in self._fields.items():
-            result += _type.serialize(getattr(self, attr))
-
-        return Int.serialize(len(result)) + result
+            setattr(self, attr, fields[attr].clean(value))
 
     @classmethod
     def unpack(cls, data: bytes):
-        kwargs = {}
+        if not data:
+            raise ValidationError()
         pack_cls = cls.__class__.packets.get(data[0])
         if pack_cls is None:
             raise ValidationError()
 
-        tail = data
-        for attr, _type in pack_cls._fields.items():
-            value, tail = _type.deserialize(tail)
-            kwargs[attr] = value
+        try:
+            return pack_cls._unpack(data)
+        except struct.error:
+            raise ValidationError()
+
+
+class ReplyCache:
 
-        return pack_cls(**kwargs)
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._frames = {}
+        self._sessions = {}
+
+    def preload(self, *packet_classes):
+        for packet_cls in packet_classes:
+            self._frames[packet_cls] = packet_cls().pack()
+
+    def frame(self, packet_cls):
+        try:
+            frame = self._frames[packet_cls]
+        except KeyError:
+            self.misses += 1
+            frame = self._frames[packet_cls] = packet_cls().pack()
+        else:
+            self.hits += 1
+        return frame
+
+    def session(self, packet_cls, session):
+        frames = self._sessions.get(session)
+        if frames is None:
+            frames = self._sessions[session] = {}
+        try:
+            frame = frames[packet_cls]
+        except KeyError:
+            self.misses += 1
+            frame = frames[packet_cls] = packet_cls(session=session).pack()
+        else:
+            self.hits += 1
+        return frame
+
+    def evict(self, session):
+        self._sessions.pop(session, None)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'frames': len(self._frames),
+                'sessions': len(self._sessions)}
+
+
+def unpack_frame(data):
+    # exactly one frame, as a datagram carries it
+    LENGTH = 4
+    if (len(data) < LENGTH or
+            int.from_bytes(data[:LENGTH], 'little') != len(data) - LENGTH):
+        raise ValidationError()
+    return Packet.unpack(data[LENGTH:])
 
 
 def feed():
     LENGTH = 4
+    COMPACT_SIZE = 64 * 1024
     buffer = bytearray()
+    offset = 0
+    packets = []
     while True:
-        while len(buffer) < LENGTH:
-            buffer += yield None
-
-        _len, buffer = Int.deserialize(buffer)
-
-        while len(buffer) < _len:
-            buffer += yield None
-
-        try:
-            packet = Packet.unpack(buffer[:_len])
-        except ValidationError:
-            packet = None
-        finally:
-            del buffer[:_len]
-            buffer += yield packet
+        data = yield packets
+        packets = []
+        if data:
+            buffer += data
+
+        with memoryview(buffer) as view:
+            size = len(view)
+            while size - offset >= LENGTH:
+                _len = int.from_bytes(view[offset:offset + LENGTH], 'little')
+                end = offset + LENGTH + _len
+                if end > size:
+                    break
+                try:
+                    packets.append(Packet.unpack(view[offset + LENGTH:end]))
+                except (ValidationError, UnicodeDecodeError):
+                    pass
+                offset = end
+
+        if offset == len(buffer):
+            buffer.clear()
+            offset = 0
+        elif offset >= COMPACT_SIZE:
+            del buffer[:offset]
+            offset = 0
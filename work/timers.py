@@ -0,0 +1,212 @@
+import time
+import heapq
+import threading
+from itertools import count
+
+from .delayedcall import DelayedCall
+
+
+class HeapTimers:
+
+    COMPACT_MIN = 64
+
+    def __init__(self):
+        self._heap = []
+        self._counter = count()
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._heap) - self.cancelled
+
+    def push(self, dc):
+        dc.timers = self
+        heapq.heappush(self._heap, (dc.when, next(self._counter), dc))
+
+    def cancel(self, dc):
+        self.cancelled += 1
+        if (self.cancelled > self.COMPACT_MIN and
+                self.cancelled * 2 > len(self._heap)):
+            self._heap = [entry for entry in self._heap
+                          if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self.cancelled = 0
+
+    def pop_due(self, now, due):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            dc = heapq.heappop(heap)[2]
+            dc.timers = None
+            if dc.cancelled:
+                self.cancelled -= 1
+            else:
+                due.append(dc)
+
+    def next_timeout(self, now, default):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)[2].timers = None
+            self.cancelled -= 1
+        if not heap:
+            return default
+        return min(max(heap[0][0] - now, 0), default)
+
+
+class TimingWheel:
+
+    COMPACT_MIN = 64
+
+    def __init__(self, resolution=0.01, slots=256, levels=4, start=None):
+        if start is None:
+            start = time.monotonic()
+        self.resolution = resolution
+        self.slots = slots
+        self.spans = [slots ** level for level in range(levels + 1)]
+        self.wheels = [[[] for i in range(slots)] for level in range(levels)]
+        self.overflow = []
+        self.ready = []
+        self.tick = int(start / resolution)
+        self.count = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return self.count - self.cancelled
+
+    def push(self, dc):
+        dc.timers = self
+        self.count += 1
+        self._place(dc, -int(-dc.when // self.resolution))
+
+    def _place(self, dc, tick):
+        delta = tick - self.tick
+        if delta <= 0:
+            self.ready.append(dc)
+            return
+        for level, wheel in enumerate(self.wheels):
+            if delta < self.spans[level + 1]:
+                wheel[tick // self.spans[level] % self.slots].append(dc)
+                return
+        self.overflow.append(dc)
+
+    def _cascade(self, entries):
+        for dc in entries:
+            if not dc.cancelled:
+                self._place(dc, -int(-dc.when // self.resolution))
+            else:
+                self._drop(dc)
+
+    def _drop(self, dc):
+        dc.timers = None
+        self.count -= 1
+        self.cancelled -= 1
+
+    def cancel(self, dc):
+        self.cancelled += 1
+        if (self.cancelled > self.COMPACT_MIN and
+                self.cancelled * 2 > self.count):
+            for slots in self.wheels + [[self.overflow, self.ready]]:
+                for entries in slots:
+                    entries[:] = [dc for dc in entries if not dc.cancelled]
+            self.count -= self.cancelled
+            self.cancelled = 0
+
+    def _fire(self, entries, due):
+        for dc in entries:
+            dc.timers = None
+            self.count -= 1
+            if dc.cancelled:
+                self.cancelled -= 1
+            else:
+                due.append(dc)
+        entries.clear()
+
+    def pop_due(self, now, due):
+        target = int(now / self.resolution)
+        if self.ready:
+            self._fire(self.ready, due)
+        if not self.count:
+            self.tick = max(self.tick, target)
+            return
+
+        spans, slots, wheels = self.spans, self.slots, self.wheels
+        while self.tick < target:
+            self.tick += 1
+            tick = self.tick
+            level = 1
+            while level < len(wheels) and tick % spans[level] == 0:
+                level += 1
+            if level == len(wheels) and tick % spans[level] == 0:
+                overflow, self.overflow = self.overflow, []
+                self._cascade(overflow)
+            for level in range(level - 1, 0, -1):
+                entries = wheels[level][tick // spans[level] % slots]
+                if entries:
+                    wheels[level][tick // spans[level] % slots] = []
+                    self._cascade(entries)
+            entries = wheels[0][tick % slots]
+            if entries:
+                self._fire(entries, due)
+            if not self.count:
+                self.tick = target
+                break
+        if self.ready:
+            self._fire(self.ready, due)
+
+    def next_timeout(self, now, default):
+        if self.ready:
+            return 0
+        if not self.count:
+            return default
+        wheel, slots = self.wheels[0], self.slots
+        for delta in range(1, slots + 1):
+            tick = self.tick + delta
+            if wheel[tick % slots]:
+                break
+            if tick % slots == 0:
+                break
+        return min(max(tick * self.resolution - now, 0), default)
+
+
+class TimerThread(threading.Thread):
+
+    DEFAULT_TIMEOUT = 1
+
+    def __init__(self, timers=None):
+        super().__init__(name='timers', daemon=True)
+        self.timers = timers if timers is not None else HeapTimers()
+        self.condition = threading.Condition()
+        self._running = True
+
+    def call_later(self, delay, cb, *args):
+        dcall = DelayedCall(self, time.monotonic() + delay, cb, args)
+        if dcall is not None:
+            with self.condition:
+                self.timers.push(dcall)
+                dcall.timers = self
+                self.condition.notify()
+            return dcall
+
+    def cancel(self, dc):
+        with self.condition:
+            if dc.timers is self:
+                self.timers.cancel(dc)
+
+    def run(self):
+        while True:
+            due = []
+            with self.condition:
+                while self._running and not due:
+                    now = time.monotonic()
+                    self.timers.pop_due(now, due)
+                    if not due:
+                        self.condition.wait(self.timers.next_timeout(
+                            now, self.DEFAULT_TIMEOUT))
+                if not self._running:
+                    return
+            for dc in due:
+                if not dc.cancelled:
+                    dc()
+
+    def stop(self):
+        with self.condition:
+            self._running = False
+            self.condition.notify()
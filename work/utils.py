@@ -1,3 +1,5 @@
+import os
+import stat
 import socket
 import random
 import hashlib
@@ -27,6 +29,15 @@ def handle_timeout():
         pass
 
 
+def unlink_socket(path):
+    # only a stale socket file, never anything else found at the path
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
 def get_conn_data(conn, length):
     msg = bytes()
     while len(msg) < length:
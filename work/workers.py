@@ -0,0 +1,209 @@
+import os
+import signal
+import socket
+import logging
+from struct import Struct
+
+from .loop import EventLoop
+from .layer import Transport, Factory, Protocol
+
+
+class ChannelProtocol(Protocol):
+
+    HEADER = Struct('<BI')
+    BROADCAST, FINISH = 1, 2
+
+    def __init__(self, transport, received, lost):
+        super().__init__(transport)
+        self.received = received
+        self.lost = lost
+        self.buffer = bytearray()
+
+    def connection_made(self):
+        pass
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        header, offset = self.HEADER, 0
+        while len(buffer) - offset >= header.size:
+            kind, length = header.unpack_from(buffer, offset)
+            start = offset + header.size
+            if len(buffer) - start < length:
+                break
+            offset = start + length
+            self.received(self, kind, bytes(buffer[start:offset]))
+        del buffer[:offset]
+
+    def send(self, kind, data=b''):
+        if self.transport is not None:
+            self.transport.write(self.HEADER.pack(kind, len(data)) + data)
+
+    def connection_lost(self, reason=None):
+        if self.transport is not None:
+            super().connection_lost(reason)
+            self.lost(self)
+
+
+def open_channel(eventloop, sock, owner, received, lost):
+    # owner is anything with a clients dict, as the transport expects
+    sock.setblocking(False)
+    transport = Transport(eventloop)
+    protocol = ChannelProtocol(transport, received, lost)
+    transport.conn, transport.protocol = sock, protocol
+    protocol.factory = owner
+    eventloop.handlers[sock.fileno()] = transport
+    eventloop.poller.register(sock, transport.READ_MASK)
+    return protocol
+
+
+class WorkerFactory(Factory):
+
+    def __init__(self, eventloop, protocol, channel, read_budget=None,
+                 **kwargs):
+        super().__init__(eventloop, protocol, read_budget, **kwargs)
+        self.finishing = False
+        self.channel = open_channel(eventloop, channel, self,
+                                    self.channel_received, self.channel_lost)
+
+    def create_server(self):
+        sock = super().create_server()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return sock
+
+    def broadcast(self, data):
+        super().broadcast(data)
+        self.channel.send(ChannelProtocol.BROADCAST, data)
+
+    def finish(self):
+        # the other workers are told to finish too
+        if not self.finishing:
+            self.finish_worker()
+            self.channel.send(ChannelProtocol.FINISH)
+
+    def finish_worker(self):
+        self.finishing = True
+        self.close()
+        self.eventloop.call_later(self.FINISH_GRACE, self.stop)
+
+    def stop(self, eventloop):
+        eventloop.stop()
+
+    def channel_received(self, channel, kind, data):
+        if kind == ChannelProtocol.BROADCAST:
+            super().broadcast(data)
+        elif kind == ChannelProtocol.FINISH and not self.finishing:
+            self.finish_worker()
+
+    def channel_lost(self, channel):
+        # the supervisor is gone
+        self.eventloop.stop()
+
+
+class Supervisor:
+
+    RESTART_DELAY = 0.5
+
+    def __init__(self, workers, target, eventloop=None):
+        self.count = workers
+        self.target = target
+        self.eventloop = eventloop if eventloop is not None else EventLoop()
+        self.workers = {}
+        self.clients = {}
+        self.finishing = False
+        self.restarts = 0
+
+    def start(self):
+        signal.signal(signal.SIGCHLD, self.child_exited)
+        signal.signal(signal.SIGTERM, self.terminated)
+        for i in range(self.count):
+            self.spawn()
+
+    def run(self):
+        self.start()
+        try:
+            self.eventloop.run()
+        finally:
+            self.terminate()
+
+    def spawn(self, eventloop=None):
+        parent, child = socket.socketpair()
+        pid = os.fork()
+        if not pid:
+            parent.close()
+            self.run_worker(child)
+        child.close()
+        channel = open_channel(self.eventloop, parent, self,
+                               self.relay, self.channel_lost)
+        self.clients[parent.fileno()] = channel
+        self.workers[pid] = channel
+        logging.info('worker %d started', pid)
+
+    def run_worker(self, sock):
+        status = 1
+        try:
+            for signum in (signal.SIGCHLD, signal.SIGTERM):
+                signal.signal(signum, signal.SIG_DFL)
+            # ctrl-c reaches the whole group, the supervisor stops us
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for channel in self.clients.values():
+                channel.transport.conn.close()
+            self.eventloop.close()
+            self.target(sock)
+            status = 0
+        except BaseException:
+            logging.exception('worker %d failed', os.getpid())
+        finally:
+            os._exit(status)
+
+    def relay(self, channel, kind, data):
+        if kind == ChannelProtocol.FINISH:
+            self.finishing = True
+        for other in list(self.clients.values()):
+            if other is not channel:
+                other.send(kind, data)
+
+    def channel_lost(self, channel):
+        pass
+
+    def child_exited(self, signum, frame):
+        self.eventloop.call_soon_threadsafe(self.reap)
+
+    def terminated(self, signum, frame):
+        self.eventloop.stop()
+
+    def reap(self, eventloop):
+        # only our own workers: the process may have other children
+        for pid in list(self.workers):
+            try:
+                reaped, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                reaped, status = pid, 0
+            if not reaped:
+                continue
+            self.workers.pop(pid).connection_lost()
+            if not self.finishing:
+                if os.WIFSIGNALED(status):
+                    status = -os.WTERMSIG(status)
+                else:
+                    status = os.WEXITSTATUS(status)
+                logging.warning('worker %d exited with status %d, restarting',
+                                pid, status)
+                self.restarts += 1
+                eventloop.call_later(self.RESTART_DELAY, self.spawn)
+        if self.finishing and not self.workers:
+            eventloop.stop()
+
+    def terminate(self):
+        self.finishing = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.workers.pop(pid).connection_lost()